@@ -0,0 +1,209 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from typing import Dict, List
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+
+from cache import cache
+from llm import set_call_limit, set_streaming
+from main import (
+    clone_repository,
+    extract_user_repo_from_url,
+    fork_repository,
+    process_repository,
+    publish_results,
+)
+from tracing import tracer
+
+# Stages a repository moves through, in order. A resumed batch continues from the last completed stage.
+STAGES = ['pending', 'forked', 'cloned', 'generated', 'published']
+CLONE_ATTEMPTS = 3
+CLONE_RETRY_DELAY = 10
+
+
+class BatchState:
+    """
+    Per-repository progress for a batch, checkpointed to a JSON file after every stage.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.repos: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                self.repos = json.load(file)
+
+    def add(self, url: str):
+        self.repos.setdefault(url, {'status': 'pending'})
+
+    def update(self, url: str, **fields):
+        self.repos[url].update(fields, updated=time.time())
+        self.save()
+
+    def save(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.repos, file, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def remaining(self) -> List[str]:
+        return [url for url, repo in self.repos.items() if repo['status'] != 'published']
+
+
+def read_repo_urls(path: str) -> List[str]:
+    """
+    Reads GitHub repository URLs from a file, one per line. Blank lines and # comments are ignored.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        lines = [line.split('#', 1)[0].strip() for line in file]
+    return [line for line in lines if line]
+
+
+def reached(repo: dict, stage: str) -> bool:
+    return STAGES.index(repo['status']) >= STAGES.index(stage)
+
+
+async def process_url(url: str, state: BatchState, args, clone_limit: asyncio.Semaphore):
+    """
+    Takes one repository through fork, clone, scan/generate and publish, skipping stages
+    that a previous run already completed.
+    """
+    repo = state.repos[url]
+    user, name = extract_user_repo_from_url(url)
+
+    if not reached(repo, 'forked'):
+        fork_url = await asyncio.to_thread(fork_repository, url)
+        if not fork_url:
+            raise Exception('Failed to fork repository')
+        state.update(url, status='forked', fork_url=fork_url)
+
+    repo_path = repo.get('path') or os.path.abspath(os.path.join(args.work_dir, f'{user}__{name}'))
+    if not reached(repo, 'cloned') or not os.path.isdir(repo_path):
+        shutil.rmtree(repo_path, ignore_errors=True)
+        async with clone_limit:
+            # A fork is created asynchronously by GitHub, so it may not be clonable straight away
+            for attempt in range(CLONE_ATTEMPTS):
+                try:
+                    await asyncio.to_thread(clone_repository, repo['fork_url'], repo_path, args.fast_clone, args.clone_cache)
+                    break
+                except Exception:
+                    shutil.rmtree(repo_path, ignore_errors=True)
+                    if attempt == CLONE_ATTEMPTS - 1:
+                        raise
+                    await asyncio.sleep(CLONE_RETRY_DELAY)
+        state.update(url, status='cloned', path=repo_path)
+
+    if not reached(repo, 'generated'):
+        with tracer.span('repository', repo=url):
+            results, failed, error = await process_repository(
+                repo_path,
+                args.search_path,
+                concurrency=args.concurrency,
+                skip_seed=args.skip_seed,
+            )
+        if error:
+            raise Exception(error)
+        files = sorted({
+            os.path.relpath(os.path.join(repo_path, path), repo_path)
+            for cur in results for path in cur if path != 'seed.sql'
+        })
+        state.update(url, status='generated', files=files, failed_components=failed)
+
+    if not args.no_publish:
+        # Read the generated files back from disk so a resumed batch can publish without regenerating
+        results = []
+        for path in repo.get('files', []):
+            with open(os.path.join(repo_path, path), 'r', encoding='utf-8') as file:
+                results.append({path: file.read()})
+        await asyncio.to_thread(publish_results, repo_path, repo['fork_url'], results)
+        state.update(url, status='published')
+
+
+async def run_batch(urls: List[str], args) -> BatchState:
+    """
+    Processes repositories with a pool of workers pulling from a shared queue.
+    Clone and LLM call limits are shared by all workers.
+    """
+    state = BatchState(args.state)
+    for url in urls:
+        state.add(url)
+    state.save()
+
+    set_call_limit(args.max_llm_calls)
+    clone_limit = asyncio.Semaphore(args.max_clones)
+    queue: asyncio.Queue = asyncio.Queue()
+    for url in state.remaining():
+        queue.put_nowait(url)
+
+    async def worker():
+        while True:
+            try:
+                url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            repo = state.repos[url]
+            # Remember the last completed stage so a failed repository is retried from there
+            if repo['status'] == 'failed':
+                repo['status'] = repo.get('stage', 'pending')
+            print(f'Processing {url} ({repo["status"]})')
+            try:
+                await process_url(url, state, args, clone_limit)
+                print(f'Finished {url}')
+            except Exception as e:
+                print(f'Failed to process {url}: {e!r}')
+                state.update(url, stage=repo['status'], status='failed', error=repr(e))
+
+    await asyncio.gather(*(worker() for _ in range(max(1, args.workers))))
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fork, clone, refactor and publish a list of GitHub repositories.')
+    parser.add_argument('repo_list', type=str, help='File with one GitHub repository URL per line.')
+    parser.add_argument('--state', type=str, default='batch-state.json', help='Checkpoint file used to resume an interrupted batch.')
+    parser.add_argument('--work-dir', type=str, default='batch-repos', help='Directory the repositories are cloned into.')
+    parser.add_argument('--search-path', type=str, default='src/components', help='Path to search for the components directory (relative to the repository root).')
+    parser.add_argument('--fast-clone', action='store_true', help='Make shallow, blobless clones that only check out source files.')
+    parser.add_argument('--clone-cache', type=str, default=None, help='Directory of local mirrors reused across batches to speed up cloning.')
+    parser.add_argument('--workers', type=int, default=4, help='Number of repositories processed at the same time.')
+    parser.add_argument('--concurrency', type=int, default=1, help='Maximum number of components per repository generated at the same time.')
+    parser.add_argument('--max-clones', type=int, default=2, help='Maximum number of clones running at the same time across all workers.')
+    parser.add_argument('--max-llm-calls', type=int, default=8, help='Maximum number of LLM calls in flight across all workers.')
+    parser.add_argument('--stream', action='store_true', help='Stream LLM replies and stop each one as soon as its first code block is complete.')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the LLM result cache.')
+    parser.add_argument('--skip-seed', action='store_true', help='Write the generated files without executing the seed SQL.')
+    parser.add_argument('--no-publish', action='store_true', help='Leave the generated files in the local clones instead of pushing them to the forks.')
+    parser.add_argument('--trace', type=str, metavar='FILE', help='Write a JSON trace of every pipeline stage to this file.')
+    parser.add_argument('--metrics', type=str, metavar='FILE', help='Write a Prometheus text summary of the pipeline stages to this file.')
+
+    args = parser.parse_args()
+    cache.enabled = not args.no_cache
+    set_streaming(args.stream)
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    state = asyncio.run(run_batch(read_repo_urls(args.repo_list), args))
+
+    failed = [url for url, repo in state.repos.items() if repo['status'] == 'failed']
+    print(f'{len(state.repos) - len(failed)} repositories processed, {len(failed)} failed')
+
+    if cache.enabled:
+        print(cache.stats())
+        cache.evict()
+
+    if args.trace:
+        tracer.write_json(args.trace)
+    if args.metrics:
+        tracer.write_prometheus(args.metrics)
+
+    if failed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+PREAMBLE = "Let's think step by step about the structure of the code before writing it."
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    A deterministic stand-in for ChatOpenAI that answers each of the scraper's prompts
+    with a plausible fenced code block after a configurable delay.
+    """
+
+    model_name: str = "fake-gpt-4"
+    # Seconds spent on each call, spread over the chunks when streaming
+    latency: float = 0.5
+    # Words of reasoning before and after the code block, like GPT-4's replies to our prompts
+    preamble_tokens: int = 150
+    trailing_tokens: int = 50
+    # Words per streamed chunk
+    chunk_size: int = 4
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def reply(self, messages: List[BaseMessage]) -> str:
+        system = messages[0].content if messages else ""
+        user = messages[-1].content if messages else ""
+        digest = hashlib.sha256(user.encode("utf-8")).hexdigest()
+        name_match = re.search(r"export default function (\w+)", user)
+        name = name_match.group(1) if name_match else "Component"
+        table = f"{name.lower()}_{digest[:6]}"
+
+        if "PostgreSQL query generator" in system:
+            block = f'```sql\nCREATE TABLE "{table}" (\n    id SERIAL PRIMARY KEY,\n    name VARCHAR(255),\n    amount INTEGER\n);\n```'
+        elif "insert hard coded data" in system:
+            values = ", ".join(f"('Customer {i}', {int(digest[i:i + 2], 16)})" for i in range(8))
+            block = f'```sql\nINSERT INTO "{table}" (name, amount) VALUES {values};\n```'
+        elif "Next.js API route" in system:
+            block = f'```typescript\nimport {{ neon }} from "@neondatabase/serverless";\nimport {{ NextResponse }} from "next/server";\n\nconst sql = neon(process.env.DATABASE_URL);\n\nexport async function GET(): Promise<NextResponse> {{\n    const rows = await sql`SELECT * FROM "{table}";`\n    return NextResponse.json(rows)\n}}\n```'
+        elif "top-level React component" in system:
+            block = f"```tsx\n'use client'\nimport {{ useEffect, useState }} from 'react'\n\nexport default function Page() {{\n  const [items, setItems] = useState([])\n  useEffect(() => {{ fetch('/api/{name}').then(r => r.json()).then(setItems) }}, [])\n  return <main>{{items.length}}</main>\n}}\n```"
+        elif "its props as a JSON object" in system:
+            return f'{{"name": "{name}", "props": {{"items": "{{ name: string; amount: number }}[]"}}}}'
+        else:
+            block = f"```tsx\ninterface {name}Props {{\n  items: {{ name: string; amount: number }}[]\n}}\n\nexport default function {name}({{ items }}: {name}Props) {{\n  return <div>{{items.map(item => <span key={{item.name}}>{{item.name}}</span>)}}</div>\n}}\n```"
+
+        return f"{self._words(self.preamble_tokens)}\n\n{block}\n\n{self._words(self.trailing_tokens)}"
+
+    def _words(self, count: int) -> str:
+        words = PREAMBLE.split()
+        return " ".join(words[i % len(words)] for i in range(count))
+
+    def _message(self, messages: List[BaseMessage]) -> AIMessage:
+        self.calls += 1
+        content = self.reply(messages)
+        input_tokens = sum(len(str(m.content).split()) for m in messages)
+        output_tokens = len(content.split())
+        return AIMessage(content=content, usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        })
+
+    def _chunks(self, messages: List[BaseMessage]) -> List[str]:
+        self.calls += 1
+        pieces = re.findall(r"\S+\s*|\s+", self.reply(messages))
+        return ["".join(pieces[i:i + self.chunk_size]) for i in range(0, len(pieces), self.chunk_size)]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        chunks = self._chunks(messages)
+        for chunk in chunks:
+            time.sleep(self.latency / len(chunks))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        chunks = self._chunks(messages)
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / len(chunks))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
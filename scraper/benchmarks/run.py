@@ -0,0 +1,120 @@
+"""
+Benchmarks the scan and orchestration layers against a synthetic repository and a fake LLM.
+Run from the scraper directory:
+
+    python -m benchmarks.run --components 40 --pages 20 --latency 0.2 --concurrency 8
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+from benchmarks.fake_llm import FakeChatModel
+from benchmarks.synthetic import generate_repo
+from cache import cache
+from llm import agenerate_code, agenerate_page, set_model
+from main import find_tsx_files_and_usages, main
+from scanner import INDEX_FILENAME, iter_source_files
+
+
+def measure(name: str, fn: Callable[[], Dict[str, float]]) -> Dict[str, float]:
+    """
+    Runs a scenario, recording wall-clock time and peak traced memory.
+    :param name: Name of the scenario.
+    :param fn: The scenario, returning a dictionary of counters used to compute throughput.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        counters = fn()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {'scenario': name, 'seconds': round(seconds, 4), 'peak_mb': round(peak / 1024 / 1024, 2)}
+    for counter, value in counters.items():
+        result[counter] = value
+        result[f'{counter}_per_second'] = round(value / seconds, 2) if seconds else 0
+    return result
+
+
+def run_benchmarks(args) -> list:
+    model = FakeChatModel(latency=args.latency, preamble_tokens=args.preamble_tokens, trailing_tokens=args.trailing_tokens)
+    set_model(model)
+    cache.enabled = False
+
+    repo_path = os.path.join(args.work_dir, 'repo')
+    components = generate_repo(repo_path, args.components, args.pages, args.imports_per_page, args.node_modules_files)
+    source_files = sum(1 for _ in iter_source_files(repo_path))
+    results = []
+
+    def scan():
+        find_tsx_files_and_usages(repo_path)
+        return {'files': source_files}
+
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(os.path.join(repo_path, INDEX_FILENAME))
+    results.append(measure('scan (cold index)', scan))
+    results.append(measure('scan (warm index)', scan))
+
+    file_contents, file_usages, _ = find_tsx_files_and_usages(repo_path)
+    component = components[0]
+
+    def generate():
+        model.calls = 0
+        async def generate_component():
+            cur = await agenerate_code(component, file_contents[component])
+            generated = [(component, cur[f'src/components/{component}'])]
+            await asyncio.gather(*(agenerate_page(reference, generated) for reference in file_usages[component]))
+        asyncio.run(generate_component())
+        return {'llm_calls': model.calls}
+
+    results.append(measure('generate_code (1 component)', generate))
+
+    def full_run():
+        model.calls = 0
+        argv = [repo_path, '--concurrency', str(args.concurrency), '--no-cache', '--skip-seed']
+        if args.stream:
+            argv.append('--stream')
+        main(argv)
+        return {'components': len(components), 'llm_calls': model.calls}
+
+    results.append(measure(f'main (concurrency={args.concurrency})', full_run))
+    return results
+
+
+def print_results(results: list):
+    for result in results:
+        details = ', '.join(f'{k}={v}' for k, v in result.items() if k not in ('scenario', 'seconds', 'peak_mb'))
+        print(f"{result['scenario']:<32} {result['seconds']:>9.3f}s {result['peak_mb']:>9.2f} MB  {details}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the scraper against a synthetic Next.js repository and a fake LLM.')
+    parser.add_argument('--components', type=int, default=20, help='Number of components in the synthetic repository.')
+    parser.add_argument('--pages', type=int, default=10, help='Number of pages in the synthetic repository.')
+    parser.add_argument('--imports-per-page', type=int, default=4, help='Number of components each page imports.')
+    parser.add_argument('--node-modules-files', type=int, default=500, help='Number of noise files under node_modules.')
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds the fake LLM spends on each call.')
+    parser.add_argument('--preamble-tokens', type=int, default=150, help='Words the fake LLM writes before the code block.')
+    parser.add_argument('--trailing-tokens', type=int, default=50, help='Words the fake LLM writes after the code block.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrency passed to main().')
+    parser.add_argument('--stream', action='store_true', help='Pass --stream to main().')
+    parser.add_argument('--work-dir', type=str, default=None, help='Directory for the synthetic repository, defaults to a temporary directory.')
+    parser.add_argument('--output', type=str, default=None, help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        args.work_dir = args.work_dir or tmp_dir
+        results = run_benchmarks(args)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,83 @@
+import os
+import random
+import shutil
+from typing import List
+
+COMPONENT_TEMPLATE = """import {{ Card, CardContent, CardHeader, CardTitle }} from "@/components/ui/card"
+
+export default function {name}() {{
+  return (
+    <Card>
+      <CardHeader>
+        <CardTitle>{name}</CardTitle>
+      </CardHeader>
+      <CardContent>
+{rows}
+      </CardContent>
+    </Card>
+  )
+}}
+"""
+
+ROW_TEMPLATE = """        <div className="flex items-center justify-between">
+          <span>Customer {i}</span>
+          <span>${amount}.00</span>
+        </div>"""
+
+PAGE_TEMPLATE = """{imports}
+
+export default function Page() {{
+  return (
+    <main className="flex min-h-screen flex-col p-24">
+{usages}
+    </main>
+  )
+}}
+"""
+
+
+def generate_repo(path: str, components: int = 20, pages: int = 10, imports_per_page: int = 4, node_modules_files: int = 200, rows: int = 8, seed: int = 0) -> List[str]:
+    """
+    Writes a synthetic Next.js repository with v0 style components and pages that import them.
+    :param path: Directory to create the repository in. Existing contents are removed.
+    :param components: Number of components in src/components.
+    :param pages: Number of pages under src/app.
+    :param imports_per_page: Number of components imported by each page.
+    :param node_modules_files: Number of noise files under node_modules, which the scanner should skip.
+    :param rows: Number of hard coded rows in each component.
+    :param seed: Seed for the random page/component assignment.
+    :return: The component filenames.
+    """
+    rng = random.Random(seed)
+    shutil.rmtree(path, ignore_errors=True)
+
+    names = [f'Component{i}' for i in range(components)]
+    components_path = os.path.join(path, 'src', 'components')
+    os.makedirs(components_path)
+    for name in names:
+        body = '\n'.join(ROW_TEMPLATE.format(i=i, amount=rng.randint(10, 999)) for i in range(rows))
+        write(os.path.join(components_path, f'{name}.tsx'), COMPONENT_TEMPLATE.format(name=name, rows=body))
+
+    for i in range(pages):
+        used = rng.sample(names, min(imports_per_page, len(names)))
+        page = PAGE_TEMPLATE.format(
+            imports='\n'.join(f'import {name} from "@/components/{name}"' for name in used),
+            usages='\n'.join(f'      <{name} />' for name in used),
+        )
+        write(os.path.join(path, 'src', 'app', f'page{i}' if i else '', 'page.tsx'), page)
+
+    # Vendor noise that mentions components but must never be reported as a usage
+    for i in range(node_modules_files):
+        name = rng.choice(names) if names else 'Component'
+        write(
+            os.path.join(path, 'node_modules', f'pkg{i % 25}', f'file{i}.js'),
+            f'// see /components/{name}\n' + 'module.exports = {};\n' * 50,
+        )
+
+    return [f'{name}.tsx' for name in names]
+
+
+def write(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
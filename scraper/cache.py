@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from os import getenv
+from typing import List, Optional
+
+from tracing import register_metrics
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'hackathon-v0')
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class LLMCache:
+    """
+    A content-addressed on-disk cache for LLM chain results.
+    Entries are keyed by a hash of the model name and the rendered prompt messages,
+    so editing a prompt only invalidates the chains that use it and anything downstream.
+    """
+
+    def __init__(self, path: str, max_age: int = DEFAULT_MAX_AGE, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param path: Directory where cache entries are stored.
+        :param max_age: Entries older than this many seconds are evicted.
+        :param max_bytes: The cache is trimmed to this size, least recently used first.
+        """
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.enabled = True
+        self.refresh = False
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model_name: str, system: str, user: str) -> str:
+        """
+        Builds the cache key for a single LLM call.
+        :param model_name: The name of the model that answers the prompt.
+        :param system: The rendered system prompt.
+        :param user: The rendered user message(s).
+        :return: A hex digest identifying the call.
+        """
+        payload = json.dumps([model_name, system, user], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f'{key}.json')
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Looks up a cached completion.
+        :param key: A key returned by LLMCache.key.
+        :return: The cached completion, or None on a miss or when reads are disabled.
+        """
+        if not self.enabled or self.refresh:
+            self._count(hit=False)
+            return None
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+
+        if time.time() - entry.get('created', 0) > self.max_age:
+            self._count(hit=False)
+            return None
+
+        # Touch the entry so size based eviction drops least recently used entries first
+        os.utime(entry_path)
+        self._count(hit=True)
+        return entry['output']
+
+    def set(self, key: str, output: str):
+        """
+        Stores a completion in the cache.
+        :param key: A key returned by LLMCache.key.
+        :param output: The completion text.
+        """
+        if not self.enabled:
+            return
+
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        tmp_path = f'{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'created': time.time(), 'output': output}, file)
+        os.replace(tmp_path, entry_path)
+
+    def evict(self) -> int:
+        """
+        Removes expired entries and trims the cache to max_bytes.
+        :return: The number of entries removed.
+        """
+        if not os.path.isdir(self.path):
+            return 0
+
+        now = time.time()
+        entries: List[tuple] = []
+        removed = 0
+        for root, dirs, files in os.walk(self.path):
+            for file in files:
+                # Leave entries that are still being written alone
+                if not file.endswith('.json'):
+                    continue
+                entry_path = os.path.join(root, file)
+                try:
+                    stat = os.stat(entry_path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.max_age:
+                    removed += self._remove(entry_path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            removed += self._remove(entry_path)
+            total -= size
+
+        return removed
+
+    def stats(self) -> str:
+        return f'LLM cache: {self.hits} hits, {self.misses} misses'
+
+    def prometheus(self) -> str:
+        """
+        Reports cache hits and misses in the Prometheus text format.
+        """
+        with self._lock:
+            return (
+                '# TYPE scraper_llm_cache_hits_total counter\n'
+                f'scraper_llm_cache_hits_total {self.hits}\n'
+                '# TYPE scraper_llm_cache_misses_total counter\n'
+                f'scraper_llm_cache_misses_total {self.misses}\n'
+            )
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def _remove(entry_path: str) -> int:
+        try:
+            os.remove(entry_path)
+            return 1
+        except OSError:
+            return 0
+
+
+cache = LLMCache(
+    getenv('SCRAPER_CACHE_DIR', DEFAULT_CACHE_DIR),
+    max_age=int(getenv('SCRAPER_CACHE_MAX_AGE', DEFAULT_MAX_AGE)),
+    max_bytes=int(getenv('SCRAPER_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+)
+register_metrics(cache.prometheus)
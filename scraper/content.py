@@ -0,0 +1,68 @@
+import os
+import threading
+from collections import OrderedDict
+from os import getenv
+from typing import Tuple
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ContentStore:
+    """
+    A shared, lazily loaded store of file contents.
+    Usages only hold file paths; the text is read the first time it is needed
+    and kept in a bounded LRU so a page referenced by many components is loaded once.
+    Entries are checked against the file's mtime and size, so a long running process
+    does not serve files that were edited since they were loaded.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param max_bytes: Approximate upper bound for the decoded text kept in memory.
+        """
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[Tuple[int, int], str]]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def read(self, path: str) -> str:
+        """
+        Returns the contents of a file, loading it on first use.
+        :param path: Path to the file.
+        :return: The decoded file contents.
+        """
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        with open(key, 'r', encoding='utf-8') as file:
+            content = file.read()
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            self._entries[key] = (signature, content)
+            self._size += len(content)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return content
+
+    def invalidate(self, path: str):
+        """
+        Drops a cached file, e.g. after it has been rewritten.
+        :param path: Path to the file.
+        """
+        with self._lock:
+            entry = self._entries.pop(os.path.abspath(path), None)
+            if entry is not None:
+                self._size -= len(entry[1])
+
+
+content_store = ContentStore(int(getenv('SCRAPER_CONTENT_MAX_BYTES', DEFAULT_MAX_BYTES)))
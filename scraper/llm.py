@@ -1,12 +1,38 @@
 import re
-from langchain_openai import ChatOpenAI
+import asyncio
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
+from langchain_core.messages import AIMessageChunk
+from cache import cache
+from content import content_store
+from tracing import tracer
+from scheduler import scheduler
+from tsx import describe_component
+from slicing import slice_reference
 from prompts.refactor import code_generation_system_prompt
 from prompts.function import function_generation_system_prompt
-from prompts.reference import reference_refactor_system_prompt
+from prompts.reference import reference_refactor_system_prompt, reference_excerpt_refactor_system_prompt
 
-llm = ChatOpenAI(model="gpt-4")
+# Created on first use by get_model, so importing this module does not build an OpenAI client
+llm = None
+
+def get_model():
+    """
+    :return: The chat model used by every chain, creating the default ChatOpenAI client on first use.
+    """
+    global llm
+    if llm is None:
+        from langchain_openai import ChatOpenAI
+        # Retries are handled by the shared scheduler, so the client does not retry on its own
+        llm = ChatOpenAI(model="gpt-4", max_retries=0)
+    return llm
+
+def set_model(model):
+    """
+    Replaces the chat model used by every chain, e.g. with a fake model for benchmarks.
+    """
+    global llm
+    llm = model
 
 system_prompt = code_generation_system_prompt
 
@@ -76,19 +102,25 @@ prompt4 = ChatPromptTemplate.from_messages([
 prompt5 = ChatPromptTemplate.from_messages([
     ("system", reference_refactor_system_prompt),
     ("user", """
-        path
+        child components
         -----------------------
-        {path}
+        {components}
      
-        api-path
+        top-level component ({reference_file})
         -----------------------
-        {api_path}
+        {reference_code}
+     """)
+])
 
-        child component definition
+# prompt5 for large pages: only the parts of the page that matter are sent, the rest is replaced by markers
+prompt7 = ChatPromptTemplate.from_messages([
+    ("system", reference_excerpt_refactor_system_prompt),
+    ("user", """
+        child components
         -----------------------
-        {component}
+        {components}
      
-        top-level component ({reference_file})
+        top-level component excerpt ({reference_file})
         -----------------------
         {reference_code}
      """)
@@ -106,10 +138,32 @@ prompt6 = ChatPromptTemplate.from_messages([
 json_parser = JsonOutputParser()
 output_parser = StrOutputParser()
 
+code_block_pattern = re.compile(r"```(?:\w+)?\n(.*?)\n```", re.DOTALL)
+
+# When enabled, chains whose output is reduced to its first code block
+# stream the completion and stop as soon as that block is closed
+stream_code_blocks = False
+
+def set_streaming(enabled: bool):
+    global stream_code_blocks
+    stream_code_blocks = enabled
+
+def set_call_limit(limit: int):
+    """
+    Limits the number of model calls in flight, shared by every component and repository in the process.
+    """
+    scheduler.set_concurrency(limit)
+
+def estimate_tokens(messages: list) -> int:
+    # Roughly four characters per token, plus room for a typical completion
+    return sum(len(m.content) for m in messages) // 4 + 1000
+
+def total_tokens(message) -> int:
+    return (message.usage_metadata or {}).get("total_tokens", 0)
+
 def extract_code_blocks(text: str):
     # print (f'extracting code blocks from: {text}')
-    pattern = r"```(?:\w+)?\n(.*?)\n```"
-    match_tag_excluded = re.search(pattern, text, re.DOTALL)
+    match_tag_excluded = code_block_pattern.search(text)
 
     if match_tag_excluded:
         tag_excluded_code_block = match_tag_excluded.group(1)
@@ -118,52 +172,127 @@ def extract_code_blocks(text: str):
 
     return tag_excluded_code_block
 
-def generate_code(path: str, code: str, references: list = []):
-    # create a dictionary
+async def stream_until_code_block(messages: list) -> AIMessageChunk:
+    """
+    Streams a completion and returns as soon as the first fenced code block is complete.
+    Closing the stream early cancels the rest of the generation.
+    """
+    message = AIMessageChunk(content="")
+    stream = get_model().astream(messages)
+    try:
+        async for chunk in stream:
+            message += chunk
+            if "`" in chunk.content and code_block_pattern.search(message.content):
+                break
+    finally:
+        await stream.aclose()
+    return message
+
+async def run_chain(prompt: ChatPromptTemplate, inputs: dict, step: str, code_block: bool = False) -> str:
+    """
+    Runs a prompt against the model, using the on-disk cache when possible.
+    :param step: Name of the prompt, used to label the trace span.
+    :param code_block: The caller only needs the first code block of the reply.
+    """
+    messages = prompt.format_messages(**inputs)
+    model = get_model()
+    key = cache.key(
+        getattr(model, "model_name", type(model).__name__),
+        "\n".join(m.content for m in messages if m.type == "system"),
+        "\n".join(m.content for m in messages if m.type != "system"),
+    )
+    with tracer.span("chain", step=step) as span:
+        result = cache.get(key)
+        span.set(cache_hit=result is not None)
+        if result is None:
+            if code_block and stream_code_blocks:
+                message = await scheduler.run(lambda: stream_until_code_block(messages), estimate_tokens(messages), total_tokens)
+            else:
+                message = await scheduler.run(lambda: model.ainvoke(messages), estimate_tokens(messages), total_tokens)
+            result = output_parser.invoke(message)
+            usage = message.usage_metadata or {}
+            span.set(prompt_tokens=usage.get("input_tokens", 0), completion_tokens=usage.get("output_tokens", 0))
+            cache.set(key, result)
+    return result
+
+async def describe_generated_component(generated_code: str) -> str:
+    """
+    Reads the props straight from the generated TypeScript and only asks the LLM (prompt6) when that fails.
+    """
+    component_def = describe_component(generated_code)
+    if component_def is None:
+        component_def = await run_chain(prompt6, {"component": generated_code}, "prompt6")
+    return component_def
+
+def format_components(components: list) -> str:
+    """
+    :param components: (path, definition) pairs for the child components used by a page.
+    """
+    sections = []
+    for path, component_def in components:
+        file_name = path.split("/")[-1].split(".")[0]
+        sections.append(f"path: {path}\napi-path: /api/{file_name}\ndefinition:\n{component_def}")
+    return "\n\n".join(sections)
+
+async def agenerate_code(path: str, code: str):
+    """
+    Runs the prompt chains for a component as a dependency graph, starting
+    every chain as soon as the outputs it needs are available:
+
+        prompt1 -> prompt2 -> prompt3, prompt4
+
+    Pages that use the component are rewritten separately by agenerate_page, once per page.
+    """
     print(f'generating code for: {path}')
     output = {}
-    
-    code_chain = prompt1 | llm | output_parser
-    generated_code = code_chain.invoke({"code": code, "language": "typescript"})
+
+    generated_code = await run_chain(prompt1, {"code": code, "language": "typescript"}, "prompt1", code_block=True)
     generated_code = extract_code_blocks(generated_code)
-    # print('generated JSX')
-    # print(generated_code)
-    # print(extract_code_blocks(generated_code))
 
-    sql_chain = prompt2 | llm | output_parser
-    generated_sql = sql_chain.invoke({"generated_code": generated_code, "language": "sql"})
+    generated_sql = await run_chain(prompt2, {"generated_code": generated_code, "language": "sql"}, "prompt2", code_block=True)
     generated_sql = extract_code_blocks(generated_sql)
-    # print(generated_sql)
-    # print(extract_code_blocks(generated_sql))
-    # print('generated SQL')
-
-    insert_chain = prompt3 | llm | output_parser
-    generated_inserts = insert_chain.invoke({"static_code": code, "dynamic_code": generated_code, "create_table_statement": generated_sql})
-    generated_inserts = extract_code_blocks(generated_inserts)
 
-    function_chain = prompt4 | llm | output_parser
-    generated_function = function_chain.invoke({"create_table_statement": generated_sql})
-    generated_function = extract_code_blocks(generated_function)
-
-    generated_component_chain = prompt6 | llm | output_parser
-    generated_component_def = generated_component_chain.invoke({"component": generated_code})
-    # print(generated_component_def)
+    generated_inserts, generated_function = await asyncio.gather(
+        run_chain(prompt3, {"static_code": code, "dynamic_code": generated_code, "create_table_statement": generated_sql}, "prompt3", code_block=True),
+        run_chain(prompt4, {"create_table_statement": generated_sql}, "prompt4", code_block=True),
+    )
 
     file_name = path.split("/")[-1].split(".")[0]
-    generated_references = {}
-    for reference in references:
-        code = references[reference]
-        print('generating reference code for: ', reference)
-        reference_chain = prompt5 | llm | output_parser
-        generated_reference = reference_chain.invoke({"reference_file": reference, "reference_code": code, "path": path, "component": generated_component_def, "api_path": f"/api/{file_name}"})
-        generated_reference = extract_code_blocks(generated_reference)
-        generated_references[reference] = generated_reference
-        # print(generated_reference)
-
-    output[f"src/app/api/{file_name}/route.ts"] = generated_function
-    output[f"seed.sql"] = generated_sql + "" + generated_inserts
+    output[f"src/app/api/{file_name}/route.ts"] = extract_code_blocks(generated_function)
+    output[f"seed.sql"] = generated_sql + "" + extract_code_blocks(generated_inserts)
     output[f'src/components/{path}'] = generated_code
-    for reference in references:
-        output[reference] = generated_references[reference]
 
     return output
+
+async def agenerate_page(reference: str, components: list, reference_file: str = None) -> str:
+    """
+    Rewrites a page once for all of the components it uses, so that each one gets its data
+    from its own API route (props -> prompt7 on an excerpt, or prompt5).
+    :param reference: The path of the page.
+    :param components: (path, generated code) pairs for the components used by the page.
+    :param reference_file: The page's path relative to the repository root, shown in the prompt.
+        Keeping the clone's location out of the prompt lets cached rewrites be reused across clones.
+    :return: The rewritten page.
+    """
+    print('generating reference code for: ', reference)
+    component_defs = await asyncio.gather(*(describe_generated_component(generated_code) for _, generated_code in components))
+    reference_code = content_store.read(reference)
+    inputs = {"reference_file": reference_file or reference, "components": format_components(list(zip([path for path, _ in components], component_defs)))}
+
+    # Large pages are cut down to the imports, hooks and JSX that use the components
+    excerpt = slice_reference(reference_code, [path.split("/")[-1].split(".")[0] for path, _ in components])
+    if excerpt is not None:
+        span = tracer.current()
+        if span is not None:
+            span.set(excerpt_ratio=round(len(excerpt.text) / max(1, len(reference_code)), 3))
+        generated_excerpt = await run_chain(prompt7, {**inputs, "reference_code": excerpt.text}, "prompt7", code_block=True)
+        spliced = excerpt.splice(extract_code_blocks(generated_excerpt))
+        if spliced is not None:
+            return spliced
+        print(f'excerpt markers were not kept for {reference}, sending the whole file')
+
+    generated_reference = await run_chain(prompt5, {**inputs, "reference_code": reference_code}, "prompt5", code_block=True)
+    return extract_code_blocks(generated_reference)
+
+def generate_code(path: str, code: str):
+    return asyncio.run(agenerate_code(path, code))
@@ -3,15 +3,27 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from urllib.parse import urlparse
-from typing import Dict, List, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from os import getenv
+import contextlib
 import subprocess
 import os
+import sys
 import argparse
-import requests
+import asyncio
 import base64
-from llm import generate_code
-import psycopg2
+import hashlib
+import json
+from cache import cache
+from scanner import SOURCE_EXTENSIONS, find_component_usages
+from content import content_store
+from tracing import tracer
+from manifest import RunManifest, changed_since
+
+# llm (langchain), seed (psycopg2), publish and requests are imported where they are used,
+# so that --plan and other runs that never reach them start quickly
+if TYPE_CHECKING:
+    from seed import Seeder
 
 GITHUB_TOKEN = getenv('GITHUB_TOKEN')
 HEADERS = {'Authorization': f'token {GITHUB_TOKEN}'}
@@ -20,6 +32,8 @@ def fork_repository(repo_path):
     """
     Forks the given repository to the authenticated user's GitHub account.
     """
+    import requests
+
     owner, repo = repo_path.split('/')[-2:]
     fork_url = f'https://api.github.com/repos/{owner}/{repo}/forks'
     response = requests.post(fork_url, headers=HEADERS)
@@ -42,35 +56,58 @@ def replace_file_contents(repo_path, file_contents_map):
             file.write(new_content)
 
 
-def find_component_usages(repo_path: str, component_names: List[str]) -> Dict[str, Dict[str, str]]:
-    """
-    Search for component usage throughout the repo.
-    :param repo_path: The repository's local path.
-    :param component_names: A list of component names to search for without the .tsx extension.
-    :return: A dictionary where keys are component filenames and values are dictionaries containing the file path and contents where the component is used.
-    """
-    usage_dict = {name: {} for name in component_names}
-    for root, dirs, files in os.walk(repo_path):
-        for file in files:
-            if file.endswith('.tsx'):
-                file_path = os.path.join(root, file)
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    for component in component_names:
-                        # Match component usage by checking for the component name without the .tsx extension
-                        search_str = f'/components/{os.path.splitext(component)[0]}'  # Adjust based on how components are referenced in your project
-                        if search_str in content:
-                            usage_dict[component][file_path] = content
-    return usage_dict
-
-def clone_repository(repo_path: str, tmp_dir: str):
+def clone_repository(repo_path: str, tmp_dir: str, fast: bool = False, cache_dir: Optional[str] = None):
     """
     Clones a repository into a specified temporary directory.
     :param repo_path: The Git repository URL to clone.
     :param tmp_dir: The temporary directory where the repository will be cloned.
+    :param fast: Make a shallow, blobless clone that only checks out the source files the scanner reads.
+    :param cache_dir: Directory of local mirrors reused across runs. The clone is made from an up to date
+        mirror of the repository, so only new objects are fetched over the network.
     """
     print(f"Cloning repository into {tmp_dir}")
-    subprocess.run(['git', 'clone', repo_path, tmp_dir], check=True)
+    if not fast and not cache_dir:
+        subprocess.run(['git', 'clone', repo_path, tmp_dir], check=True)
+        return
+
+    source = repo_path
+    if cache_dir:
+        source = update_mirror(repo_path, cache_dir)
+    elif os.path.exists(repo_path):
+        # --depth and --filter are ignored for plain local paths
+        source = f'file://{os.path.abspath(repo_path)}'
+
+    if not fast:
+        subprocess.run(['git', 'clone', source, tmp_dir], check=True)
+    else:
+        subprocess.run(['git', 'clone', '--depth', '1', '--filter=blob:none', '--no-checkout', source, tmp_dir], check=True)
+        patterns = ['/.gitignore'] + [f'*{ext}' for ext in SOURCE_EXTENSIONS]
+        subprocess.run(['git', '-C', tmp_dir, 'sparse-checkout', 'set', '--no-cone', *patterns], check=True)
+        subprocess.run(['git', '-C', tmp_dir, 'checkout'], check=True)
+
+    if source != repo_path:
+        subprocess.run(['git', '-C', tmp_dir, 'remote', 'set-url', 'origin', repo_path], check=True)
+
+def update_mirror(repo_path: str, cache_dir: str) -> str:
+    """
+    Creates or refreshes a bare mirror of the repository in the cache directory.
+    :param repo_path: The Git repository URL to mirror.
+    :param cache_dir: Directory holding the mirrors.
+    :return: A file:// URL of the mirror.
+    """
+    name = os.path.basename(repo_path.rstrip('/')).removesuffix('.git')
+    digest = hashlib.sha1(repo_path.encode('utf-8')).hexdigest()[:12]
+    mirror_path = os.path.abspath(os.path.join(cache_dir, f'{name}-{digest}.git'))
+
+    if os.path.isdir(mirror_path):
+        subprocess.run(['git', '-C', mirror_path, 'remote', 'update', '--prune'], check=True)
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        subprocess.run(['git', 'clone', '--mirror', repo_path, mirror_path], check=True)
+        # Allow blobless clones to be served from the mirror
+        subprocess.run(['git', '-C', mirror_path, 'config', 'uploadpack.allowFilter', 'true'], check=True)
+
+    return f'file://{mirror_path}'
 
 def find_tsx_files_and_usages(tmp_dir: str, search_path: str = 'src/components') -> Tuple[Dict[str, str], Dict[str, List[str]], str]:
     """
@@ -109,6 +146,8 @@ def create_or_update_file(user, repo, path, token, content, message, branch="v1"
     :param message: Commit message.
     :param branch: Branch where the commit should be applied.
     """
+    import requests
+
     url = f"https://api.github.com/repos/{user}/{repo}/contents/{path}"
 
     headers = {
@@ -202,55 +241,346 @@ def create_git_and_checkout_branch(repo_path: str, branch_name: str = 'v1'):
     """
     subprocess.run(['git', '-C', repo_path, 'checkout', '-b', branch_name], check=False)
 
-def main():
-    parser = argparse.ArgumentParser(description='Clone a Git repository, find .tsx files in a specified directory, and list their usages.')
-    parser.add_argument('repo_path', type=str, help='The path to the Git repository on this machine.')
-    parser.add_argument('--search-path', type=str, default='src/components', help='Path to search for the components directory (relative to the repository root).')
+def group_usages_by_page(file_usages: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """
+    Inverts the component usages so every referencing file is listed once with all of the components it uses.
+    :param file_usages: A dictionary of component filenames and the paths of the files that reference them.
+    :return: A dictionary of referencing file paths and the component filenames they use.
+    """
+    pages = {}
+    for filepath, references in file_usages.items():
+        for reference in references:
+            pages.setdefault(reference, []).append(filepath)
+    return pages
 
-    args = parser.parse_args()
-    
+async def generate_all(file_contents: Dict[str, str], file_usages: Dict[str, List[str]], concurrency: int = 1, repo_path: str = '.') -> List[Tuple[str, Optional[dict], Optional[Exception], List[str]]]:
+    """
+    Runs agenerate_code for every component, then agenerate_page once for every page that uses them,
+    with at most `concurrency` components or pages in flight. A page is rewritten as soon as all of its
+    components are done, for the ones that succeeded, so it is not overwritten once per component.
+    A failure in one component or page is captured and does not abort the others.
+    :param file_contents: A dictionary of component filenames and their contents.
+    :param file_usages: A dictionary of component filenames and the paths of the files that reference them.
+    :param concurrency: The maximum number of components and pages processed at the same time.
+    :param repo_path: The path to the Git repository on the local system.
+    :return: A list of (filepath, result, error, components) tuples, the components in the same order as file_contents
+        followed by the pages in path order. Pages are identified by their path relative to the repository root
+        and list the components their rewrite wired up; components list nothing.
+    """
+    from llm import agenerate_code, agenerate_page
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    pages = group_usages_by_page({filepath: file_usages[filepath] for filepath in file_contents})
+
+    async def run(filepath: str, content: str):
+        async with semaphore:
+            try:
+                with tracer.span('component', component=filepath):
+                    cur = await agenerate_code(filepath, content)
+                return filepath, cur, None, []
+            except Exception as e:
+                print(f'Failed to generate code for {filepath}: {e!r}')
+                return filepath, None, e, []
+
+    components = {filepath: asyncio.ensure_future(run(filepath, content)) for filepath, content in file_contents.items()}
+
+    async def run_page(reference: str, filepaths: List[str]):
+        # Results are keyed by the path relative to the repository root, like the other generated files
+        page = os.path.relpath(reference, repo_path).replace(os.sep, '/')
+        generated = []
+        for filepath in filepaths:
+            _, cur, error, _ = await components[filepath]
+            if not error:
+                generated.append((filepath, cur[f'src/components/{filepath}']))
+        if not generated:
+            return None
+        # Acquire the semaphore only once the components are done, so waiting pages do not hold it
+        async with semaphore:
+            try:
+                with tracer.span('page', page=page, components=len(generated)):
+                    code = await agenerate_page(reference, generated, page)
+                return page, {page: code}, None, [filepath for filepath, _ in generated]
+            except Exception as e:
+                print(f'Failed to rewrite {page}: {e!r}')
+                return page, None, e, [filepath for filepath, _ in generated]
+
+    page_outcomes = await asyncio.gather(*(run_page(reference, pages[reference]) for reference in sorted(pages)))
+    component_outcomes = [await components[filepath] for filepath in file_contents]
+    return component_outcomes + [outcome for outcome in page_outcomes if outcome is not None]
+
+def apply_result(repo_path: str, filepath: str, cur: dict, seeder: Optional['Seeder']):
+    """
+    Executes the seed SQL and writes the generated files for a single component or page.
+    :param repo_path: The path to the Git repository on the local system.
+    :param filepath: The component filename or page path the result was generated for.
+    :param cur: The dictionary returned by generate_code.
+    :param seeder: The seeder holding the run's database transaction, or None to skip seeding.
+    """
+    # get seed.sql from cur and execute the sql
+    seed_sql = cur.get('seed.sql')
+    if seed_sql and seeder is not None:
+        print(f'Executing SQL for {filepath}')
+        with tracer.span('seed', component=filepath):
+            seeder.apply(seed_sql)
+
+    for path, value in cur.items():
+        if path != 'seed.sql':
+            # write the file to the repo, creating missing paths
+            # if they do not exist
+            full_path = os.path.join(repo_path, path)
+            with tracer.span('write', component=filepath, path=path, bytes=len(value)):
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                with open(full_path, 'w') as file:
+                    print(f'writing:{path}')
+                    file.write(value)
+            content_store.invalidate(full_path)
+
+def publish_results(repo_path: str, repo_url: str, results: List[dict], branch: str = 'v1'):
+    """
+    Pushes every generated file to the GitHub repository as a single commit.
+    :param repo_path: The path to the Git repository on the local system.
+    :param repo_url: The GitHub URL of the repository to publish to.
+    :param results: The dictionaries returned by generate_code.
+    :param branch: Branch where the commit should be applied.
+    """
+    files = {}
+    for cur in results:
+        for path, value in cur.items():
+            if path != 'seed.sql':
+                rel_path = os.path.relpath(os.path.join(repo_path, path), repo_path)
+                files[rel_path.replace(os.sep, '/')] = value
+
+    if not files:
+        print('No files to publish')
+        return
+
+    from publish import GitHubPublisher
+
+    user, repo = extract_user_repo_from_url(repo_url)
+    with tracer.span('publish', files=len(files)):
+        GitHubPublisher(user, repo, GITHUB_TOKEN).publish(files, 'Load v0 component data from the database', branch)
+
+def apply_results(repo_path: str, outcomes: list, skip_seed: bool = False, seed_dry_run: bool = False) -> Tuple[List[dict], List[str]]:
+    """
+    Seeds the database and writes the generated files for every successful component and page, in order.
+    A page is skipped when a component its rewrite relies on could not be applied, since the page
+    would fetch an API route and pass props that were never written.
+    :param repo_path: The path to the Git repository on the local system.
+    :param outcomes: The list returned by generate_all.
+    :param skip_seed: Write the files without executing the seed SQL.
+    :param seed_dry_run: Validate the seed SQL and roll it back instead of committing.
+    :return: A tuple containing the applied results and the failed component filenames and page paths.
+    """
+    results = []
+    failed = []
+    if skip_seed:
+        # Runs that never seed do not need psycopg2
+        seeding = contextlib.nullcontext()
+    else:
+        from seed import Seeder
+        seeding = Seeder(getenv('DATABASE_URL'), dry_run=seed_dry_run)
+    with seeding as seeder:
+        for filepath, cur, error, components in outcomes:
+            if error:
+                failed.append(filepath)
+                continue
+            missing = [component for component in components if component in failed]
+            if missing:
+                print(f'Skipping {filepath}, components it uses failed: {", ".join(missing)}')
+                failed.append(filepath)
+                continue
+            try:
+                apply_result(repo_path, filepath, cur, seeder)
+                results.append(cur)
+            except Exception as e:
+                print(f'Failed to apply results for {filepath}: {e!r}')
+                failed.append(filepath)
+    return results, failed
+
+def select_changed_components(repo_path: str, search_path: str, file_contents: Dict[str, str], file_usages: Dict[str, List[str]], manifest: RunManifest, since: Optional[str] = None) -> Dict[str, str]:
+    """
+    Filters the components down to the ones affected by edits to the component or the files that reference it.
+    :param repo_path: The path to the Git repository on the local system.
+    :param search_path: Path to the components directory within the repository.
+    :param file_contents: A dictionary of component filenames and their contents.
+    :param file_usages: A dictionary of component filenames and the paths of the files that reference them.
+    :param manifest: The manifest written by the previous run.
+    :param since: Compare against this git revision instead of the manifest.
+    :return: The subset of file_contents to regenerate.
+    """
+    changed = changed_since(repo_path, since) if since else None
+    selected = {}
+    for filepath, content in file_contents.items():
+        component_path = os.path.normpath(os.path.join(search_path, filepath))
+        if changed is not None:
+            affected = component_path in changed or any(manifest.relative(r) in changed for r in file_usages[filepath])
+        else:
+            affected = manifest.is_changed(component_path, file_usages[filepath])
+        if affected:
+            selected[filepath] = content
+
+    print(f'{len(selected)} of {len(file_contents)} component(s) changed')
+    return selected
+
+def plan_repository(repo_path: str, search_path: str = 'src/components', changed_only: bool = False, since: Optional[str] = None) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Works out what a run would generate without loading the LLM or database code.
+    :param repo_path: The path to the Git repository on the local system.
+    :param search_path: Path to the components directory within the repository.
+    :param changed_only: Only list components whose file or referencing files changed since the last run.
+    :param since: Only list components whose file or referencing files changed since this git revision.
+    :return: A tuple containing the plan, with the components and their usages and the pages and the components
+        they use (paths relative to the repository root), and an error message if any.
+    """
+    file_contents, file_usages, error = find_tsx_files_and_usages(repo_path, search_path)
+    if error:
+        return None, error
+
+    if changed_only or since:
+        file_contents = select_changed_components(repo_path, search_path, file_contents, file_usages, RunManifest(repo_path), since)
+
+    def relative(path: str) -> str:
+        # Usage paths already start with repo_path
+        return os.path.relpath(path, repo_path).replace(os.sep, '/')
+
+    components = {filepath: sorted(relative(reference) for reference in file_usages[filepath]) for filepath in sorted(file_contents)}
+    pages = group_usages_by_page({filepath: file_usages[filepath] for filepath in file_contents})
+    return {
+        'components': components,
+        'pages': {relative(reference): sorted(filepaths) for reference, filepaths in sorted(pages.items())},
+    }, None
+
+def record_manifest(manifest: RunManifest, search_path: str, file_contents: Dict[str, str], file_usages: Dict[str, List[str]], outcomes: list, failed: List[str]):
+    """
+    Records the components this run regenerated in the manifest and saves it.
+    A component only counts as done once every page that uses it has been rewritten too.
+    :param manifest: The manifest loaded at the start of the run.
+    :param search_path: Path to the components directory within the repository.
+    :param file_contents: A dictionary of component filenames and their contents.
+    :param file_usages: A dictionary of component filenames and the paths of the files that reference them.
+    :param outcomes: The list returned by generate_all.
+    :param failed: The failed component filenames and page paths returned by apply_results.
+    """
+    written = [path for filepath, cur, error, _ in outcomes if not error and filepath not in failed for path in cur if path != 'seed.sql']
+    for filepath, cur, error, _ in outcomes:
+        if filepath not in file_contents or error or filepath in failed:
+            continue
+        references = [manifest.relative(reference).replace(os.sep, '/') for reference in file_usages[filepath]]
+        if any(reference in failed for reference in references):
+            continue
+        outputs = [path for path in cur if path != 'seed.sql'] + references
+        manifest.record(os.path.normpath(os.path.join(search_path, filepath)), file_usages[filepath], outputs)
+    manifest.refresh(written)
+    manifest.save()
+
+async def process_repository(repo_path: str, search_path: str = 'src/components', concurrency: int = 1, skip_seed: bool = False, seed_dry_run: bool = False, publish_url: Optional[str] = None, changed_only: bool = False, since: Optional[str] = None) -> Tuple[List[dict], List[str], Optional[str]]:
+    """
+    Runs the scan, generate, write/seed and publish stages for a repository that is already on this machine.
+    :param repo_path: The path to the Git repository on the local system.
+    :param search_path: Path to the components directory within the repository.
+    :param concurrency: The maximum number of components processed at the same time.
+    :param skip_seed: Write the files without executing the seed SQL.
+    :param seed_dry_run: Validate the seed SQL and roll it back instead of committing.
+    :param publish_url: The GitHub URL to push the generated files to, if any.
+    :param changed_only: Only regenerate components whose file or referencing files changed since the last run.
+    :param since: Only regenerate components whose file or referencing files changed since this git revision.
+    :return: A tuple containing the applied results, the filenames of the failed components and an error message if any.
+    """
     # Find v0 components and references to the components in pages
-    file_contents, file_usages, error = find_tsx_files_and_usages(args.repo_path, args.search_path)
+    with tracer.span('scan', repo=repo_path):
+        file_contents, file_usages, error = await asyncio.to_thread(find_tsx_files_and_usages, repo_path, search_path)
     print (f'{file_usages}')
 
     if error:
-        print(error)
-        exit(1)
+        return [], [], error
+
+    # Hashing files and running git would block other repositories sharing the event loop
+    manifest = await asyncio.to_thread(RunManifest, repo_path)
+    if changed_only or since:
+        file_contents = await asyncio.to_thread(select_changed_components, repo_path, search_path, file_contents, file_usages, manifest, since)
 
     # Create a new branch before making changes
-    create_git_and_checkout_branch(args.repo_path)
+    await asyncio.to_thread(create_git_and_checkout_branch, repo_path)
 
     # Pass files and references to Langchain/LLM and
     # store them to create a PR with the changes
-    results = []
-    for filepath, content in file_contents.items():
-        cur = generate_code(filepath, content, file_usages[filepath])
-        results.append(cur)
-        # get seed.sql from cur and execute the sql
-        seed_sql = cur.get('seed.sql')
-        if seed_sql:
-            print(f'Executing SQL for {filepath}')
-            connection_string = os.getenv('DATABASE_URL')
-            connection = psycopg2.connect(connection_string)
-
-            cursor = connection.cursor()
-            cursor.execute(seed_sql)
-            connection.commit()
-
-            cursor.close()
-            connection.close()
+    outcomes = await generate_all(file_contents, file_usages, concurrency, repo_path)
 
-        for path, value in cur.items():
-            if path != 'seed.sql':
-                # write the file to the repo, creating missing paths
-                # if they do not exist
-                full_path = os.path.join(args.repo_path, path)
-                os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                with open(full_path, 'w') as file:
-                    print(f'writing:{path}')
-                    file.write(value)
+    # Apply the results in component order so runs are reproducible
+    # regardless of which component finished first
+    results, failed = await asyncio.to_thread(apply_results, repo_path, outcomes, skip_seed, seed_dry_run)
+
+    # Record what this run produced so the next --changed-only run can skip it
+    await asyncio.to_thread(record_manifest, manifest, search_path, file_contents, file_usages, outcomes, failed)
+
+    if failed:
+        print(f'Failed to generate code for {len(failed)} component(s) or page(s): {", ".join(failed)}')
+
+    if publish_url:
+        await asyncio.to_thread(publish_results, repo_path, publish_url, results)
+
+    return results, failed, None
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Clone a Git repository, find .tsx files in a specified directory, and list their usages.')
+    parser.add_argument('repo_path', type=str, help='The path to the Git repository on this machine.')
+    parser.add_argument('--search-path', type=str, default='src/components', help='Path to search for the components directory (relative to the repository root).')
+    parser.add_argument('--concurrency', type=int, default=1, help='Maximum number of components to generate code for at the same time.')
+    parser.add_argument('--stream', action='store_true', help='Stream LLM replies and stop each one as soon as its first code block is complete.')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the LLM result cache.')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached LLM results but store the new ones.')
+    parser.add_argument('--changed-only', action='store_true', help='Only regenerate components whose file or referencing files changed since the last run.')
+    parser.add_argument('--since', type=str, metavar='REV', help='Only regenerate components whose file or referencing files changed since this git revision.')
+    parser.add_argument('--publish', type=str, metavar='REPO_URL', help='Push the generated files to this GitHub repository as a single commit on the v1 branch.')
+    parser.add_argument('--trace', type=str, metavar='FILE', help='Write a JSON trace of every pipeline stage to this file.')
+    parser.add_argument('--metrics', type=str, metavar='FILE', help='Write a Prometheus text summary of the pipeline stages to this file.')
+    parser.add_argument('--plan', '--scan-only', action='store_true', help='Print the components, their usages and the pages that would be rewritten as JSON and exit, without calling the LLM.')
+    parser.add_argument('--skip-seed', action='store_true', help='Write the generated files without executing the seed SQL.')
+    parser.add_argument('--seed-dry-run', action='store_true', help='Validate the generated seed SQL against the database and roll it back instead of committing.')
+
+    args = parser.parse_args(argv)
+
+    if args.plan:
+        # Keep stdout to the JSON plan
+        with contextlib.redirect_stdout(sys.stderr):
+            plan, error = plan_repository(args.repo_path, args.search_path, args.changed_only, args.since)
+        if error:
+            print(error, file=sys.stderr)
+            exit(1)
+        print(json.dumps(plan, indent=2))
+        return
+
+    from llm import set_streaming
+
+    cache.enabled = not args.no_cache
+    cache.refresh = args.refresh
+    set_streaming(args.stream)
+    tracer.reset()
+
+    results, failed, error = asyncio.run(process_repository(
+        args.repo_path,
+        args.search_path,
+        concurrency=args.concurrency,
+        skip_seed=args.skip_seed,
+        seed_dry_run=args.seed_dry_run,
+        publish_url=args.publish,
+        changed_only=args.changed_only,
+        since=args.since,
+    ))
+
+    if error:
+        print(error)
+        exit(1)
+
+    if cache.enabled:
+        print(cache.stats())
+        cache.evict()
+
+    if args.trace:
+        tracer.write_json(args.trace)
+    if args.metrics:
+        tracer.write_prometheus(args.metrics)
 
-    
     # https://github.com/evanshortiss/hackathon-v0/compare/main...neon-v1-bot:hackathon-v0:v1?expand=1
     # username, repo_name = extract_user_repo_from_url(args.repo_path)
     # print(f'\nVisit the following URL to preview and merge your changes: https://github.com/{username}/{repo_name}/compare/main..{username}:{repo_name}:v1?expand=1')
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import subprocess
+import time
+from typing import Dict, Iterable, List, Set
+
+MANIFEST_FILENAME = '.scraper-manifest.json'
+MANIFEST_VERSION = 1
+
+
+def hash_file(path: str) -> str:
+    try:
+        with open(path, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except OSError:
+        return ''
+
+
+def changed_since(repo_path: str, rev: str) -> Set[str]:
+    """
+    Lists files that differ from a git revision, including uncommitted and untracked changes.
+    :param repo_path: The path to the Git repository on the local system.
+    :param rev: The revision to compare the working tree against.
+    :return: Paths relative to the repository root.
+    """
+    diff = subprocess.run(['git', '-C', repo_path, 'diff', '--name-only', rev], check=True, capture_output=True, text=True)
+    untracked = subprocess.run(['git', '-C', repo_path, 'ls-files', '--others', '--exclude-standard'], check=True, capture_output=True, text=True)
+    return {os.path.normpath(line) for line in (diff.stdout + untracked.stdout).splitlines() if line}
+
+
+class RunManifest:
+    """
+    Records, per component, the content hashes of the component and its referencing files
+    after the last successful run, along with the files that run generated.
+    It is stored in the repository root and used to only regenerate components affected by later edits.
+    """
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self.path = os.path.join(repo_path, MANIFEST_FILENAME)
+        self.components: Dict[str, dict] = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') == MANIFEST_VERSION:
+                self.components = data.get('components', {})
+        except (OSError, ValueError):
+            pass
+
+    def relative(self, path: str) -> str:
+        """
+        :param path: A path as returned by the scanner, which starts with the repository path.
+        :return: The path relative to the repository root.
+        """
+        return os.path.normpath(os.path.relpath(path, self.repo_path))
+
+    def is_changed(self, component_path: str, references: List[str]) -> bool:
+        """
+        :param component_path: The component file, relative to the repository root.
+        :param references: Paths of the files that reference the component, as returned by the scanner.
+        :return: True if the component or its references changed since the last recorded run.
+        """
+        entry = self.components.get(component_path)
+        if entry is None:
+            return True
+        if entry['hash'] != hash_file(os.path.join(self.repo_path, component_path)):
+            return True
+        current = {self.relative(reference) for reference in references}
+        if current != set(entry['references']):
+            return True
+        return any(entry['references'][reference] != hash_file(os.path.join(self.repo_path, reference)) for reference in current)
+
+    def record(self, component_path: str, references: List[str], outputs: Iterable[str]):
+        """
+        Stores the current state of a component after its outputs have been written.
+        :param component_path: The component file, relative to the repository root.
+        :param references: Paths of the files that reference the component, as returned by the scanner.
+        :param outputs: Paths of the files generated for the component, relative to the repository root.
+        """
+        self.components[component_path] = {
+            'hash': hash_file(os.path.join(self.repo_path, component_path)),
+            'references': {
+                reference: hash_file(os.path.join(self.repo_path, reference))
+                for reference in sorted(self.relative(r) for r in references)
+            },
+            'outputs': sorted(os.path.normpath(output) for output in outputs),
+            'updated': time.time(),
+        }
+
+    def refresh(self, written: Iterable[str]):
+        """
+        Updates the recorded hashes of files this run rewrote, so a page shared by several
+        components is not treated as edited for the components that were not regenerated.
+        :param written: Paths of the files written during the run, relative to the repository root.
+        """
+        written = {os.path.normpath(path) for path in written}
+        for component_path, entry in self.components.items():
+            if component_path in written:
+                entry['hash'] = hash_file(os.path.join(self.repo_path, component_path))
+            for reference in entry['references']:
+                if reference in written:
+                    entry['references'][reference] = hash_file(os.path.join(self.repo_path, reference))
+
+    def save(self):
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'version': MANIFEST_VERSION, 'components': self.components}, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
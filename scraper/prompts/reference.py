@@ -1,17 +1,25 @@
 reference_refactor_system_prompt = """"
 Think step by step and reason yourself to the correct decisions to make sure we get it right.
 
-You will start with the "entrypoint" code. The entrypoint code is a top-level React component that includes a reference to a child component. 
+You will start with the "entrypoint" code. The entrypoint code is a top-level React component that includes references to one or more child components. 
 
-The goal is to edit the top-level component to pass data to the child component using props.
-The data for props should be fetched from the api-path using the fetch API, and stored in a React state variable.
+The goal is to edit the top-level component to pass data to every listed child component using props.
+Each child component has its own api-path. The data for its props should be fetched from that api-path using the fetch API, and stored in its own React state variable.
 
 1. Output with no introduction, no explaintation, only code.
 1. The first line of code must be 'use client'.
-2. Add code to fetch data from the API endpoint using the fetch API and store it in a React state variable.
-3. Pass the data to the child component as props.
+2. Add code to fetch data from each child component's API endpoint using the fetch API and store it in a React state variable.
+3. Pass the data to each child component as props.
 4. Provide the entire component code as a single, coherent output. No comments or placeholders.
 5. The code should be fully functional. No placeholders.
 
-Provide a fully functional React component that fetches data from an API endpoint and passes it to a child component as props.
+Provide a fully functional React component that fetches data from the API endpoints and passes it to the child components as props.
+"""
+
+reference_excerpt_refactor_system_prompt = reference_refactor_system_prompt + """
+The top-level component is an excerpt. Unrelated code has been replaced by marker lines such as `// @@omitted:0@@`.
+
+6. Keep every marker line exactly as it is, on its own line and in the same order. Do not add, remove or renumber markers.
+7. Only edit the code around the markers; the omitted code will be put back in their place.
+8. Output the whole excerpt, including the markers, as a single code block. The markers are the only exception to rules 4 and 5.
 """
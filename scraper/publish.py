@@ -0,0 +1,118 @@
+import time
+from os import getenv
+from typing import Dict, Optional
+
+import requests
+
+GITHUB_API_URL = getenv('GITHUB_API_URL', 'https://api.github.com')
+MAX_RATE_LIMIT_RETRIES = 3
+MAX_RATE_LIMIT_WAIT = 15 * 60
+
+# Shared keep-alive session so every GitHub call in the process reuses connections
+session = requests.Session()
+session.headers.update({'Accept': 'application/vnd.github.v3+json'})
+
+
+class GitHubPublisher:
+    """
+    Publishes a set of files to a branch as a single commit using the Git Data API
+    (trees, commits and refs) instead of one contents API commit per file.
+    """
+
+    def __init__(self, user: str, repo: str, token: str, api_url: str = GITHUB_API_URL, http: Optional[requests.Session] = None):
+        """
+        :param user: Username of the repository owner.
+        :param repo: Name of the repository.
+        :param token: GitHub Personal Access Token (PAT) with repo scope.
+        :param api_url: Base URL of the GitHub API, e.g. a local fake server for testing.
+        :param http: The requests session to use, defaults to the shared session.
+        """
+        self.repo_url = f"{api_url.rstrip('/')}/repos/{user}/{repo}"
+        self.token = token
+        self.http = http or session
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Sends a request to the repository API, waiting and retrying when GitHub reports a rate limit.
+        :param method: The HTTP method.
+        :param path: Path relative to the repository URL, e.g. `/git/trees`.
+        """
+        headers = {'Authorization': f'token {self.token}'}
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            response = self.http.request(method, f'{self.repo_url}{path}', headers=headers, **kwargs)
+            wait = rate_limit_wait(response)
+            if wait is None or attempt == MAX_RATE_LIMIT_RETRIES:
+                return response
+            print(f'GitHub rate limit reached, retrying in {wait:.0f}s')
+            time.sleep(wait)
+        return response
+
+    def _json(self, method: str, path: str, expected=(200, 201), **kwargs) -> dict:
+        response = self.request(method, path, **kwargs)
+        if response.status_code not in expected:
+            raise Exception(f'GitHub API {method} {path} failed ({response.status_code}): {response.text}')
+        return response.json()
+
+    def publish(self, files: Dict[str, str], message: str, branch: str = 'v1') -> str:
+        """
+        Commits all files to the branch in one commit, creating the branch from the default branch if needed.
+        :param files: A dictionary of repository relative paths and their new contents.
+        :param message: Commit message.
+        :param branch: Branch where the commit should be applied.
+        :return: The SHA of the new commit.
+        """
+        ref = self.request('GET', f'/git/ref/heads/{branch}')
+        branch_exists = ref.status_code == 200
+        if branch_exists:
+            parent_sha = ref.json()['object']['sha']
+        else:
+            default_branch = self._json('GET', '')['default_branch']
+            parent_sha = self._json('GET', f'/git/ref/heads/{default_branch}')['object']['sha']
+
+        base_tree = self._json('GET', f'/git/commits/{parent_sha}')['tree']['sha']
+
+        # Inline content lets the trees endpoint create every blob in the same request
+        tree = self._json('POST', '/git/trees', json={
+            'base_tree': base_tree,
+            'tree': [
+                {'path': path, 'mode': '100644', 'type': 'blob', 'content': content}
+                for path, content in sorted(files.items())
+            ],
+        })
+
+        commit = self._json('POST', '/git/commits', json={
+            'message': message,
+            'tree': tree['sha'],
+            'parents': [parent_sha],
+        })
+
+        if branch_exists:
+            self._json('PATCH', f'/git/refs/heads/{branch}', json={'sha': commit['sha']})
+        else:
+            self._json('POST', '/git/refs', json={'ref': f'refs/heads/{branch}', 'sha': commit['sha']})
+
+        print(f'Published {len(files)} file(s) to {branch} in commit {commit["sha"]}')
+        return commit['sha']
+
+
+def rate_limit_wait(response: requests.Response) -> Optional[float]:
+    """
+    Works out how long to wait before retrying a rate limited GitHub response.
+    :return: The number of seconds to wait, or None if the response was not rate limited.
+    """
+    if response.status_code not in (403, 429):
+        return None
+
+    retry_after = response.headers.get('Retry-After')
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), MAX_RATE_LIMIT_WAIT)
+        except ValueError:
+            return None
+
+    if response.headers.get('X-RateLimit-Remaining') == '0':
+        reset = response.headers.get('X-RateLimit-Reset')
+        if reset is not None:
+            return min(max(float(reset) - time.time(), 0) + 1, MAX_RATE_LIMIT_WAIT)
+
+    return None
@@ -0,0 +1,171 @@
+import fnmatch
+import json
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Set
+
+SOURCE_EXTENSIONS = ('.tsx', '.ts', '.jsx', '.js')
+INDEX_FILENAME = '.scraper-index'
+INDEX_VERSION = 1
+
+# Build output, dependencies and tooling folders that never contain page sources
+IGNORED_DIRS = {
+    'node_modules', 'bower_components', 'vendor',
+    'dist', 'build', 'out', 'coverage', 'storybook-static',
+    '.next', '.git', '.turbo', '.vercel', '.cache', '.output',
+}
+
+
+def load_ignore_patterns(repo_path: str) -> List[str]:
+    """
+    Reads directory patterns from the repository's top-level .gitignore.
+    Only simple name patterns are supported since they cover the usual build folders.
+    :param repo_path: The repository's local path.
+    :return: A list of fnmatch patterns for directory names.
+    """
+    patterns = []
+    try:
+        with open(os.path.join(repo_path, '.gitignore'), 'r', encoding='utf-8') as file:
+            for line in file:
+                line = line.strip()
+                if not line or line.startswith(('#', '!')):
+                    continue
+                line = line.strip('/')
+                if line and '/' not in line:
+                    patterns.append(line)
+    except OSError:
+        pass
+    return patterns
+
+
+def iter_source_files(repo_path: str) -> Iterator[str]:
+    """
+    Walks the repository and yields source files, pruning ignored and vendor directories.
+    :param repo_path: The repository's local path.
+    :return: An iterator of file paths.
+    """
+    patterns = load_ignore_patterns(repo_path)
+    for root, dirs, files in os.walk(repo_path):
+        dirs[:] = [
+            d for d in dirs
+            if d not in IGNORED_DIRS
+            and not d.startswith('.')
+            and not any(fnmatch.fnmatch(d, p) for p in patterns)
+        ]
+        for file in files:
+            if file.endswith(SOURCE_EXTENSIONS):
+                yield os.path.join(root, file)
+
+
+def compile_usage_pattern(component_names: List[str]) -> 're.Pattern[bytes]':
+    """
+    Builds a single regular expression that matches an import of any of the components.
+    The name must be followed by a non identifier character so that `Card` does not match `CardHeader`.
+    :param component_names: Component filenames, with or without the extension.
+    :return: A compiled bytes pattern whose first group is the matched component name.
+    """
+    names = sorted({os.path.splitext(c)[0] for c in component_names}, key=len, reverse=True)
+    alternation = b'|'.join(re.escape(name.encode('utf-8')) for name in names)
+    return re.compile(rb'/components/(' + alternation + rb')(?![\w-])')
+
+
+def scan_file(file_path: str, pattern: 're.Pattern[bytes]') -> Set[str]:
+    """
+    Finds the components imported by a single file.
+    :param file_path: Path to the file to scan.
+    :param pattern: A pattern returned by compile_usage_pattern.
+    :return: The set of matched component names, without the extension.
+    """
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    if b'/components/' not in content:
+        return set()
+    return {m.group(1).decode('utf-8') for m in pattern.finditer(content)}
+
+
+class UsageIndex:
+    """
+    A persistent record of the components each source file imports, stored in the repository root.
+    Files are identified by mtime and size, so only files that changed since the last scan are read again.
+    The index is discarded when the set of component names changes.
+    """
+
+    def __init__(self, repo_path: str, component_names: List[str]):
+        self.path = os.path.join(repo_path, INDEX_FILENAME)
+        self.components = sorted({os.path.splitext(c)[0] for c in component_names})
+        self.files: Dict[str, dict] = {}
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == INDEX_VERSION and data.get('components') == self.components:
+            self.files = data.get('files', {})
+
+    def lookup(self, rel_path: str, stat: os.stat_result) -> Optional[List[str]]:
+        """
+        :return: The cached matches for the file, or None if it is new or has changed.
+        """
+        entry = self.files.get(rel_path)
+        if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return entry['matches']
+        return None
+
+    def update(self, rel_path: str, stat: os.stat_result, matches: Set[str]):
+        self.files[rel_path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'matches': sorted(matches)}
+
+    def save(self, seen: Set[str]):
+        """
+        Writes the index back to disk, dropping files that no longer exist.
+        :param seen: Relative paths of every file visited during the scan.
+        """
+        files = {path: entry for path, entry in self.files.items() if path in seen}
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({'version': INDEX_VERSION, 'components': self.components, 'files': files}, file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f'Failed to write usage index: {e}')
+
+
+def find_component_usages(repo_path: str, component_names: List[str], use_index: bool = True) -> Dict[str, List[str]]:
+    """
+    Search for component usage throughout the repo.
+    All components are matched in a single pass over each source file. Only paths are returned,
+    the contents of referencing files are loaded on demand through content.content_store.
+    :param repo_path: The repository's local path.
+    :param component_names: A list of component filenames to search for.
+    :param use_index: Reuse and update the persistent usage index so unchanged files are not read again.
+    :return: A dictionary where keys are component filenames and values are the paths of the files where the component is used.
+    """
+    usage_dict = {name: [] for name in component_names}
+    if not component_names:
+        return usage_dict
+
+    by_name: Dict[str, List[str]] = {}
+    for component in component_names:
+        by_name.setdefault(os.path.splitext(component)[0], []).append(component)
+
+    pattern = compile_usage_pattern(component_names)
+    index = UsageIndex(repo_path, component_names) if use_index else None
+    seen = set()
+    for file_path in iter_source_files(repo_path):
+        if index is None:
+            matches = scan_file(file_path, pattern)
+        else:
+            rel_path = os.path.relpath(file_path, repo_path)
+            stat = os.stat(file_path)
+            seen.add(rel_path)
+            matches = index.lookup(rel_path, stat)
+            if matches is None:
+                matches = scan_file(file_path, pattern)
+                index.update(rel_path, stat, matches)
+        for name in matches:
+            for component in by_name[name]:
+                usage_dict[component].append(file_path)
+
+    if index is not None:
+        index.save(seen)
+    return usage_dict
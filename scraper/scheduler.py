@@ -0,0 +1,350 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from os import getenv
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from tracing import register_metrics, tracer
+
+T = TypeVar('T')
+
+RETRIABLE_STATUS_CODES = {408, 409, 429}
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at `per_minute` tokens per minute.
+    Reservations may drive the balance negative; callers then sleep until it is paid back,
+    so waiting requests are served in the order they reserved.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes `amount` tokens from the bucket.
+        :return: The number of seconds to wait before the reservation is covered.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount: float):
+        """
+        Corrects an earlier reservation once the real cost is known. Positive amounts return tokens.
+        """
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RequestScheduler:
+    """
+    Coordinates every LLM call in the process: request and token rate limits, a concurrency limit,
+    retries with jittered exponential backoff that honour Retry-After, per-attempt timeouts
+    and optional hedged requests for calls that run past a latency percentile.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_concurrency: Optional[int] = None, max_retries: int = 5, timeout: Optional[float] = 180,
+                 backoff: float = 1.0, max_backoff: float = 60.0, hedge_percentile: Optional[float] = None,
+                 hedge_min_samples: int = 20):
+        """
+        :param requests_per_minute: Request budget, or None for no limit.
+        :param tokens_per_minute: Token budget (prompt plus expected completion), or None for no limit.
+        :param max_concurrency: Maximum calls in flight, or None for no limit.
+        :param max_retries: Retries after the first attempt for rate limits, timeouts and server errors.
+        :param timeout: Seconds before an attempt is abandoned, or None to wait forever.
+        :param backoff: Base delay in seconds for exponential backoff.
+        :param max_backoff: Upper bound for a single backoff delay.
+        :param hedge_percentile: Send a duplicate request once a call exceeds this latency percentile (e.g. 0.95).
+        :param hedge_min_samples: Number of completed calls needed before hedging starts.
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+
+        self.latencies = deque(maxlen=500)
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.in_flight = 0
+        self.wait_seconds = 0.0
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.rate_limited = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    def set_concurrency(self, limit: Optional[int]):
+        self.max_concurrency = limit
+        self._semaphore = None
+
+    def _get_semaphore(self) -> Optional[asyncio.Semaphore]:
+        if not self.max_concurrency:
+            return None
+        # asyncio primitives belong to one event loop; recreate the semaphore if the loop changed
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        :return: The latency after which a duplicate request is sent, or None if hedging is off.
+        """
+        if not self.hedge_percentile or len(self.latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))]
+
+    async def run(self, call: Callable[[], Awaitable[T]], estimated_tokens: int = 0, actual_tokens: Optional[Callable[[T], int]] = None) -> T:
+        """
+        Runs an LLM call under the scheduler's limits.
+        :param call: A function that starts a new attempt each time it is called.
+        :param estimated_tokens: Tokens charged to the token budget before the call.
+        :param actual_tokens: Returns the real token usage from a result, used to correct the budget.
+        :return: The result of the first successful attempt.
+        """
+        span = tracer.current()
+        queued = time.monotonic()
+        semaphore = self._get_semaphore()
+        acquired = False
+        self._count(queue_depth=1)
+        try:
+            if semaphore is not None:
+                await semaphore.acquire()
+                acquired = True
+            await self._wait_for_budget(estimated_tokens)
+        except BaseException:
+            if acquired:
+                semaphore.release()
+            raise
+        finally:
+            self._count(queue_depth=-1)
+
+        waited = time.monotonic() - queued
+        self._count(wait_seconds=waited, calls=1, in_flight=1)
+        if span is not None:
+            span.set(queue_wait=round(waited, 6))
+
+        attempt = 0
+        try:
+            while True:
+                try:
+                    start = time.monotonic()
+                    result = await self._attempt(call, estimated_tokens)
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retriable(e):
+                        if span is not None:
+                            span.set(retries=attempt)
+                        raise
+                    attempt += 1
+                    delay = self._retry_delay(e, attempt)
+                    self._count(retries=1)
+                    print(f'LLM call failed ({type(e).__name__}), retrying in {delay:.1f}s')
+                    await asyncio.sleep(delay)
+                    await self._wait_for_budget(estimated_tokens)
+                    continue
+
+                with self._lock:
+                    self.latencies.append(time.monotonic() - start)
+                if span is not None:
+                    span.set(retries=attempt)
+                if self.tokens and actual_tokens is not None:
+                    used = actual_tokens(result)
+                    if used:
+                        self.tokens.adjust(estimated_tokens - used)
+                return result
+        finally:
+            self._count(in_flight=-1)
+            if acquired:
+                semaphore.release()
+
+    async def _wait_for_budget(self, estimated_tokens: int):
+        delay = 0.0
+        if self.requests:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens and estimated_tokens:
+            delay = max(delay, self.tokens.reserve(estimated_tokens))
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _reserve_now(self, estimated_tokens: int) -> bool:
+        """
+        Charges one request and `estimated_tokens` against the budgets, but only if neither would have to wait.
+        :return: Whether the budget was charged.
+        """
+        delay = 0.0
+        if self.requests:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens and estimated_tokens:
+            delay = max(delay, self.tokens.reserve(estimated_tokens))
+        if not delay:
+            return True
+        if self.requests:
+            self.requests.adjust(1)
+        if self.tokens and estimated_tokens:
+            self.tokens.adjust(estimated_tokens)
+        return False
+
+    async def _attempt(self, call: Callable[[], Awaitable[T]], estimated_tokens: int = 0) -> T:
+        hedge_after = self.hedge_delay()
+        if hedge_after is None:
+            return await self._with_timeout(call())
+
+        primary = asyncio.ensure_future(self._with_timeout(call()))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        # A hedge is a real request: it needs a free concurrency slot and budget that is available now,
+        # otherwise it would only add to the load that is slowing the primary down
+        semaphore = self._get_semaphore()
+        if semaphore is not None and semaphore.locked():
+            return await primary
+        if not self._reserve_now(estimated_tokens):
+            return await primary
+        if semaphore is not None:
+            await semaphore.acquire()
+        # Whichever attempt loses keeps its estimated tokens charged, the provider bills it all the same
+        self._count(hedges=1, calls=1, in_flight=1)
+        hedge = asyncio.ensure_future(self._with_timeout(call()))
+        hedge.add_done_callback(lambda _: self._finish_hedge(semaphore))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count(hedge_wins=1)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _finish_hedge(self, semaphore: Optional[asyncio.Semaphore]):
+        # A done callback rather than a finally block, so the slot is freed even if the task is cancelled before it starts
+        self._count(in_flight=-1)
+        if semaphore is not None:
+            semaphore.release()
+
+    async def _with_timeout(self, awaitable: Awaitable[T]) -> T:
+        try:
+            return await asyncio.wait_for(awaitable, self.timeout)
+        except asyncio.TimeoutError:
+            self._count(timeouts=1)
+            raise
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            self._count(rate_limited=1)
+            return min(retry_after, self.max_backoff)
+        # Full jitter keeps retries from many workers from arriving together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def prometheus(self) -> str:
+        """
+        Reports queue depth, waits and retry counters in the Prometheus text format.
+        """
+        with self._lock:
+            lines = [
+                '# TYPE scraper_llm_queue_depth gauge',
+                f'scraper_llm_queue_depth {self.queue_depth}',
+                '# TYPE scraper_llm_queue_depth_max gauge',
+                f'scraper_llm_queue_depth_max {self.max_queue_depth}',
+                '# TYPE scraper_llm_queue_wait_seconds summary',
+                f'scraper_llm_queue_wait_seconds_count {self.calls}',
+                f'scraper_llm_queue_wait_seconds_sum {self.wait_seconds:.6f}',
+            ]
+            for name in ('retries', 'timeouts', 'rate_limited', 'hedges', 'hedge_wins'):
+                lines.append(f'# TYPE scraper_llm_{name}_total counter')
+                lines.append(f'scraper_llm_{name}_total {getattr(self, name)}')
+        return '\n'.join(lines) + '\n'
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Reads Retry-After (or OpenAI's retry-after-ms) from the HTTP response attached to an API error.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms') is not None:
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after') is not None:
+            return float(headers['retry-after'])
+    except ValueError:
+        return None
+    return None
+
+
+def is_retriable(error: Exception) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None:
+        return status in RETRIABLE_STATUS_CODES or status >= 500
+    # Connection resets and client side timeouts carry no status code
+    return any(word in type(error).__name__ for word in ('Timeout', 'Connection'))
+
+
+def optional_float(name: str) -> Optional[float]:
+    value = getenv(name)
+    return float(value) if value else None
+
+
+def timeout_setting(name: str, default: float) -> Optional[float]:
+    """
+    Reads a timeout in seconds from the environment. `0` or `none` turns the timeout off.
+    """
+    value = getenv(name, '').strip().lower()
+    if not value:
+        return default
+    if value == 'none' or float(value) <= 0:
+        return None
+    return float(value)
+
+
+scheduler = RequestScheduler(
+    requests_per_minute=optional_float('SCRAPER_REQUESTS_PER_MINUTE'),
+    tokens_per_minute=optional_float('SCRAPER_TOKENS_PER_MINUTE'),
+    max_retries=int(getenv('SCRAPER_LLM_RETRIES', 5)),
+    timeout=timeout_setting('SCRAPER_LLM_TIMEOUT', 180),
+    hedge_percentile=optional_float('SCRAPER_HEDGE_PERCENTILE'),
+)
+register_metrics(scheduler.prometheus)
@@ -0,0 +1,274 @@
+import re
+import threading
+from decimal import Decimal
+from os import getenv
+from typing import Any, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+DEFAULT_MAX_CONNECTIONS = int(getenv('SCRAPER_DB_MAX_CONNECTIONS', 4))
+
+INSERT_PATTERN = re.compile(
+    r'^\s*INSERT\s+INTO\s+((?:"[^"]+"|[\w.]+))\s*\(([^)]*)\)\s*VALUES\s*(.*?)\s*;?\s*$',
+    re.IGNORECASE | re.DOTALL,
+)
+DOLLAR_QUOTE_PATTERN = re.compile(r'\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$')
+NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?')
+WORD_PATTERN = re.compile(r'[A-Za-z]+')
+KEYWORDS = {'NULL': None, 'TRUE': True, 'FALSE': False}
+
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+    """
+    A ThreadedConnectionPool whose getconn waits for a connection to be returned
+    instead of raising PoolError when every connection is in use.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, *args, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        self._slots.acquire()
+        try:
+            return super().getconn(key)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+def get_pool(dsn: str, max_connections: int = DEFAULT_MAX_CONNECTIONS) -> ThreadedConnectionPool:
+    """
+    Returns a connection pool for the given database, creating it on first use.
+    Pools are shared for the lifetime of the process so repeated runs reuse connections.
+    A Seeder holds its connection for a whole run, so once every connection is taken
+    further runs wait for one to be returned.
+    :param dsn: The database connection string.
+    :param max_connections: Maximum number of connections held by the pool.
+    """
+    with _pools_lock:
+        pool = _pools.get(dsn)
+        if pool is None or pool.closed:
+            pool = BlockingConnectionPool(1, max_connections, dsn)
+            _pools[dsn] = pool
+        return pool
+
+
+def is_dollar_quote(sql: str, i: int) -> bool:
+    # `$1` parameters and identifiers containing `$` do not start a quote
+    if i and (sql[i - 1].isalnum() or sql[i - 1] in '_$'):
+        return False
+    return DOLLAR_QUOTE_PATTERN.match(sql, i) is not None
+
+
+def split_statements(sql: str) -> List[str]:
+    """
+    Splits a SQL script into statements on semicolons that are not inside quotes, $tag$ quotes or comments.
+    :param sql: The SQL script.
+    :return: A list of non-empty statements without the trailing semicolon.
+    """
+    statements = []
+    current = []
+    i = 0
+    while i < len(sql):
+        char = sql[i]
+        if char in ("'", '"'):
+            end = i + 1
+            while end < len(sql):
+                if sql[end] == char:
+                    # A doubled quote is an escaped quote
+                    if end + 1 < len(sql) and sql[end + 1] == char:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+        elif char == '$' and is_dollar_quote(sql, i):
+            # Function bodies and DO blocks are dollar quoted and contain semicolons of their own
+            tag = DOLLAR_QUOTE_PATTERN.match(sql, i).group(0)
+            end = sql.find(tag, i + len(tag))
+            end = len(sql) if end == -1 else end + len(tag)
+            current.append(sql[i:end])
+            i = end
+        elif sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = len(sql) if end == -1 else end
+        elif sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            i = len(sql) if end == -1 else end + 2
+        elif char == ';':
+            statements.append(''.join(current))
+            current = []
+            i += 1
+        else:
+            current.append(char)
+            i += 1
+    statements.append(''.join(current))
+    return [s.strip() for s in statements if s.strip()]
+
+
+def parse_literal_rows(values: str) -> Optional[List[Tuple[Any, ...]]]:
+    """
+    Parses the VALUES list of an INSERT made only of literals, e.g. `('a', 1), ('b', NULL)`.
+    :param values: The text after the VALUES keyword.
+    :return: A list of row tuples, or None if the list contains anything other than plain literals.
+    """
+    rows = []
+    i = 0
+    length = len(values)
+
+    def skip_whitespace(i):
+        while i < length and values[i].isspace():
+            i += 1
+        return i
+
+    while True:
+        i = skip_whitespace(i)
+        if i >= length or values[i] != '(':
+            return None
+        i += 1
+        row = []
+        while True:
+            i = skip_whitespace(i)
+            if i < length and values[i] == "'":
+                end = i + 1
+                parts = []
+                while True:
+                    quote = values.find("'", end)
+                    if quote == -1:
+                        return None
+                    parts.append(values[end:quote])
+                    if values.startswith("''", quote):
+                        parts.append("'")
+                        end = quote + 2
+                        continue
+                    break
+                row.append(''.join(parts))
+                i = quote + 1
+            else:
+                number = NUMBER_PATTERN.match(values, i)
+                word = WORD_PATTERN.match(values, i)
+                if number:
+                    text = number.group(0)
+                    # Decimal keeps the literal exact, a float would round it or overflow to Infinity
+                    row.append(Decimal(text) if any(c in text for c in '.eE') else int(text))
+                    i = number.end()
+                elif word and word.group(0).upper() in KEYWORDS:
+                    row.append(KEYWORDS[word.group(0).upper()])
+                    i = word.end()
+                else:
+                    return None
+            i = skip_whitespace(i)
+            if i < length and values[i] == ',':
+                i += 1
+            elif i < length and values[i] == ')':
+                i += 1
+                break
+            else:
+                return None
+        rows.append(tuple(row))
+        i = skip_whitespace(i)
+        if i >= length:
+            return rows
+        if values[i] != ',':
+            return None
+        i += 1
+
+
+class Seeder:
+    """
+    Applies seed scripts for a whole run over a single pooled connection and transaction.
+    Each component's script runs inside its own savepoint, so a failing script is rolled back
+    without losing the others. Runs of literal INSERTs into the same table are bulk loaded with execute_values.
+    """
+
+    def __init__(self, dsn: Optional[str] = None, dry_run: bool = False, connection=None):
+        """
+        :param dsn: The database connection string, used to obtain a connection from the shared pool.
+        :param dry_run: Execute the scripts to validate them, then roll everything back.
+        :param connection: An already open DB-API connection to use instead of the pool.
+        """
+        self.dsn = dsn
+        self.dry_run = dry_run
+        self.connection = connection
+        self._pool = None
+        self._savepoints = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.connection is None:
+            return False
+        try:
+            if exc_type is None and not self.dry_run:
+                self.connection.commit()
+                print('Seed transaction committed')
+            else:
+                self.connection.rollback()
+                if self.dry_run:
+                    print('Dry run: seed transaction rolled back')
+        finally:
+            if self._pool is not None:
+                self._pool.putconn(self.connection)
+                self.connection = None
+        return False
+
+    def apply(self, sql: str):
+        """
+        Runs one component's seed script inside a savepoint.
+        :param sql: The seed script.
+        """
+        if self.connection is None:
+            # Connect on first use so runs without seed scripts never touch the database
+            self._pool = get_pool(self.dsn)
+            self.connection = self._pool.getconn()
+        if self._savepoints == 0:
+            self.connection.autocommit = False
+
+        self._savepoints += 1
+        savepoint = f'seed_{self._savepoints}'
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'SAVEPOINT {savepoint}')
+            try:
+                self._execute_script(cursor, sql)
+            except Exception:
+                cursor.execute(f'ROLLBACK TO SAVEPOINT {savepoint}')
+                raise
+            cursor.execute(f'RELEASE SAVEPOINT {savepoint}')
+
+    def _execute_script(self, cursor, sql: str):
+        pending_target = None
+        pending_rows = []
+
+        def flush():
+            if pending_rows:
+                table, columns = pending_target
+                execute_values(cursor, f'INSERT INTO {table} ({columns}) VALUES %s', pending_rows, page_size=1000)
+                pending_rows.clear()
+
+        for statement in split_statements(sql):
+            match = INSERT_PATTERN.match(statement)
+            rows = parse_literal_rows(match.group(3)) if match else None
+            if rows is None:
+                flush()
+                cursor.execute(statement)
+                continue
+
+            target = (match.group(1), ', '.join(c.strip() for c in match.group(2).split(',')))
+            if target != pending_target:
+                flush()
+                pending_target = target
+            pending_rows.extend(rows)
+        flush()
@@ -0,0 +1,365 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import getenv
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import shutil
+import socket
+import socketserver
+import threading
+import time
+import uuid
+
+from cache import cache
+from llm import get_model, set_call_limit, set_streaming
+from main import clone_repository, extract_user_repo_from_url, process_repository
+from tracing import register_listener, tracer
+
+# Finished jobs kept for GET /jobs/<id>, oldest are dropped first
+MAX_FINISHED_JOBS = 1000
+# Spans kept for /metrics, the process runs for as long as the service does
+MAX_SPANS = 100_000
+
+_current_job: contextvars.ContextVar = contextvars.ContextVar('current_job', default=None)
+
+
+class Job:
+    """
+    A repository queued for processing, with the progress events streamed to clients.
+    """
+
+    def __init__(self, params: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.params = params
+        self.status = 'queued'
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.events: List[dict] = []
+        self._condition = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('succeeded', 'failed')
+
+    def emit(self, event: str, **fields):
+        with self._condition:
+            self.events.append({'event': event, 'time': time.time(), **fields})
+            self._condition.notify_all()
+
+    def wait_for_events(self, start: int, timeout: float = 15) -> List[dict]:
+        """
+        Blocks until there are events after `start` or the job is done.
+        :return: The new events, empty if the wait timed out.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: len(self.events) > start or self.done, timeout)
+            return self.events[start:]
+
+    def finish(self, status: str, **result):
+        with self._condition:
+            self.status = status
+            self.finished = time.time()
+            self.result = result
+            self.events.append({'event': 'job', 'time': self.finished, 'status': status, **result})
+            self._condition.notify_all()
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'params': self.params,
+            'created': self.created,
+            'finished': self.finished,
+            'result': self.result,
+        }
+
+
+def forward_span(event: str, span):
+    """
+    Streams the pipeline's trace spans to the job they belong to as progress events.
+    """
+    job = _current_job.get()
+    if job is None:
+        return
+    fields = {'phase': event, 'name': span.name, 'attributes': dict(span.attributes)}
+    if event == 'end':
+        fields.update(duration=round(span.duration, 6), error=span.error)
+    job.emit('span', **fields)
+
+
+class JobRunner:
+    """
+    Runs jobs on one background event loop, so the LLM scheduler's limits, the cache,
+    the HTTP session and the database pool are shared by every job in the process.
+    """
+
+    def __init__(self, work_dir: str, max_jobs: int = 2, fast_clone: bool = False, clone_cache: Optional[str] = None):
+        """
+        :param work_dir: Directory repositories given by URL are cloned into, each clone is removed when its job finishes.
+        :param max_jobs: Maximum number of jobs running at the same time.
+        :param fast_clone: Make shallow, blobless clones that only check out source files.
+        :param clone_cache: Directory of local mirrors reused across jobs to speed up cloning.
+        """
+        self.work_dir = work_dir
+        self.fast_clone = fast_clone
+        self.clone_cache = clone_cache
+        self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._semaphore = asyncio.Semaphore(max(1, max_jobs))
+        self._evicting = False
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='job-runner', daemon=True)
+        self._thread.start()
+
+    def submit(self, params: dict) -> Job:
+        job = Job(params)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        job.emit('job', status='queued')
+        asyncio.run_coroutine_threadsafe(self._run(job), self.loop)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self.jobs.values())
+
+    def _prune(self):
+        finished = sorted((job for job in self.jobs.values() if job.done), key=lambda job: job.finished)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+
+    async def _run(self, job: Job):
+        async with self._semaphore:
+            _current_job.set(job)
+            job.status = 'running'
+            job.emit('job', status='running')
+            try:
+                with tracer.span('job', job=job.id):
+                    result = await self._process(job.params)
+            except Exception as e:
+                print(f'Job {job.id} failed: {e!r}')
+                job.finish('failed', error=repr(e))
+                await self._evict_cache()
+                return
+            job.finish('failed' if result.get('error') else 'succeeded', **result)
+        await self._evict_cache()
+
+    async def _evict_cache(self):
+        """
+        Enforces the cache's age and size limits after a job, which a one-off run does at exit.
+        """
+        if not cache.enabled or self._evicting:
+            return
+        self._evicting = True
+        try:
+            removed = await asyncio.to_thread(cache.evict)
+            if removed:
+                print(f'Evicted {removed} LLM cache entries')
+        except Exception as e:
+            print(f'Failed to evict LLM cache entries: {e!r}')
+        finally:
+            self._evicting = False
+
+    async def _process(self, params: dict) -> dict:
+        repo = params['repo']
+        if os.path.isdir(repo):
+            return await self._process_path(os.path.abspath(repo), params)
+
+        # Every job gets its own clone, removed once the job is done so disk use stays flat
+        user, name = extract_user_repo_from_url(repo)
+        repo_path = os.path.abspath(os.path.join(self.work_dir, f'{user}__{name}__{uuid.uuid4().hex[:8]}'))
+        try:
+            with tracer.span('clone', repo=repo):
+                await asyncio.to_thread(clone_repository, repo, repo_path, params.get('fast_clone', self.fast_clone), self.clone_cache)
+            result = await self._process_path(repo_path, params)
+        finally:
+            await asyncio.to_thread(shutil.rmtree, repo_path, True)
+        result['path'] = None
+        return result
+
+    async def _process_path(self, repo_path: str, params: dict) -> dict:
+        results, failed, error = await process_repository(
+            repo_path,
+            params.get('search_path', 'src/components'),
+            concurrency=int(params.get('concurrency', 1)),
+            skip_seed=bool(params.get('skip_seed', False)),
+            seed_dry_run=bool(params.get('seed_dry_run', False)),
+            publish_url=params.get('publish'),
+            changed_only=bool(params.get('changed_only', False)),
+            since=params.get('since'),
+        )
+        files = sorted({
+            os.path.relpath(os.path.join(repo_path, path), repo_path)
+            for cur in results for path in cur if path != 'seed.sql'
+        })
+        return {'path': repo_path, 'files': files, 'failed': failed, 'error': error}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs               queue a job, e.g. {"repo": "/path/or/url", "search_path": "src/components"},
+                             a URL also needs "publish", the remote the changes are pushed to
+    GET  /jobs               list jobs
+    GET  /jobs/<id>          job status and result
+    GET  /jobs/<id>/events   progress as newline delimited JSON, streamed until the job is done
+    GET  /metrics            Prometheus metrics for every job run by the service
+    GET  /health             liveness check
+    """
+
+    runner: JobRunner = None
+
+    def do_GET(self):
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if parts == ['health']:
+            return self.send_json(200, {'status': 'ok'})
+        if parts == ['metrics']:
+            return self.send_text(200, tracer.prometheus(), 'text/plain; version=0.0.4')
+        if parts == ['jobs']:
+            return self.send_json(200, [job.to_dict() for job in self.runner.list()])
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = self.runner.get(parts[1])
+            if job is None:
+                return self.send_json(404, {'error': 'Job not found'})
+            if len(parts) == 2:
+                return self.send_json(200, job.to_dict())
+            if parts[2] == 'events':
+                return self.stream_events(job)
+        self.send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path.split('?')[0].rstrip('/') != '/jobs':
+            return self.send_json(404, {'error': 'Not found'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self.send_json(400, {'error': 'The body must be a JSON object'})
+        if not isinstance(params, dict) or not isinstance(params.get('repo'), str):
+            return self.send_json(400, {'error': 'A "repo" path or URL is required'})
+        if not os.path.isdir(params['repo']) and not params.get('publish'):
+            # The clone is removed once the job is done, so its changes have to be pushed somewhere
+            return self.send_json(400, {'error': 'Jobs for a repository URL need a "publish" remote'})
+        job = self.runner.submit(params)
+        self.send_json(202, job.to_dict(), {'Location': f'/jobs/{job.id}'})
+
+    def stream_events(self, job: Job):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        sent = 0
+        try:
+            while True:
+                events = job.wait_for_events(sent)
+                for event in events:
+                    self.wfile.write(json.dumps(event, default=str).encode('utf-8') + b'\n')
+                sent += len(events)
+                self.wfile.flush()
+                if job.done and sent >= len(job.events):
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped listening, the job carries on
+            return
+
+    def send_json(self, status: int, body, headers: Optional[dict] = None):
+        self.send_text(status, json.dumps(body, indent=2, default=str), 'application/json', headers)
+
+    def send_text(self, status: int, text: str, content_type: str, headers: Optional[dict] = None):
+        data = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # HTTPServer.server_bind expects a (host, port) address
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+def warm_up(max_jobs: int):
+    """
+    Creates the clients every job shares before the first job arrives.
+    :param max_jobs: Maximum number of jobs running at the same time, each holding one database connection while seeding.
+    """
+    get_model()
+    database_url = getenv('DATABASE_URL')
+    if database_url:
+        try:
+            from seed import DEFAULT_MAX_CONNECTIONS, get_pool
+            get_pool(database_url, max(max_jobs, DEFAULT_MAX_CONNECTIONS))
+        except Exception as e:
+            print(f'Could not connect to the database, seeding will connect on first use: {e!r}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the scraper as a long running service that accepts jobs over HTTP.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on.')
+    parser.add_argument('--socket', type=str, metavar='PATH', help='Listen on this Unix socket instead of a TCP port.')
+    parser.add_argument('--work-dir', type=str, default='server-repos', help='Directory repositories given by URL are cloned into for the duration of their job.')
+    parser.add_argument('--fast-clone', action='store_true', help='Make shallow, blobless clones that only check out source files.')
+    parser.add_argument('--clone-cache', type=str, default=None, help='Directory of local mirrors reused across jobs to speed up cloning.')
+    parser.add_argument('--max-jobs', type=int, default=2, help='Maximum number of jobs running at the same time.')
+    parser.add_argument('--max-llm-calls', type=int, default=8, help='Maximum number of LLM calls in flight across all jobs.')
+    parser.add_argument('--stream', action='store_true', help='Stream LLM replies and stop each one as soon as its first code block is complete.')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the LLM result cache.')
+
+    args = parser.parse_args()
+    tracer.max_spans = MAX_SPANS
+    tracer.reset()
+    cache.enabled = not args.no_cache
+    set_streaming(args.stream)
+    set_call_limit(args.max_llm_calls)
+    os.makedirs(args.work_dir, exist_ok=True)
+    warm_up(args.max_jobs)
+
+    RequestHandler.runner = JobRunner(args.work_dir, args.max_jobs, args.fast_clone, args.clone_cache)
+    register_listener(forward_span)
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixHTTPServer(args.socket, RequestHandler)
+        print(f'Listening on {args.socket}')
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+        print(f'Listening on http://{args.host}:{args.port}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import re
+from bisect import bisect_right
+from typing import List, Optional, Set, Tuple
+
+# Files smaller than this are sent whole, slicing them would not save much
+MIN_SLICE_LINES = 60
+# Runs of omitted lines shorter than this are kept rather than replaced with a marker
+MIN_OMITTED_LINES = 4
+# Slicing is skipped when the excerpt would still contain more than this share of the file
+MAX_KEPT_RATIO = 0.7
+# Lines of context kept around each JSX usage
+CONTEXT_LINES = 1
+
+MARKER = '// @@omitted:{}@@'
+MARKER_PATTERN = re.compile(r'@@omitted:(\d+)@@')
+# A marker line as written, or wrapped as a JSX comment; anything else on the line would be lost when splicing
+MARKER_LINE_PATTERN = re.compile(r'(?://\s*@@omitted:(\d+)@@|\{\s*/\*\s*@@omitted:(\d+)@@\s*\*/\s*\})')
+IMPORT_PATTERN = re.compile(r'^\s*import\b[^;]*?from\s*[\'"]([^\'"]+)[\'"];?', re.MULTILINE | re.DOTALL)
+HOOK_PATTERN = re.compile(r'\buse[A-Z]\w*\s*(?:<[^>]*>)?\s*\(')
+COMPONENT_START_PATTERN = re.compile(r'^\s*export\s+default\s+(?:async\s+)?function\b|^\s*(?:export\s+)?(?:default\s+)?function\s+[A-Z]', re.MULTILINE)
+
+
+class ReferenceSlice:
+    """
+    An excerpt of a referencing file with the unrelated parts replaced by numbered markers.
+    """
+
+    def __init__(self, text: str, regions: List[str]):
+        self.text = text
+        self.regions = regions
+
+    def splice(self, edited: str) -> Optional[str]:
+        """
+        Puts the omitted regions back into the LLM's edit of the excerpt.
+        :param edited: The excerpt as rewritten by the LLM.
+        :return: The full file, or None if markers were dropped, duplicated, reordered
+            or share their line with code.
+        """
+        lines = []
+        seen = []
+        for line in edited.split('\n'):
+            if MARKER_PATTERN.search(line):
+                match = MARKER_LINE_PATTERN.fullmatch(line.strip())
+                if not match:
+                    return None
+                index = int(match.group(1) or match.group(2))
+                if index >= len(self.regions):
+                    return None
+                seen.append(index)
+                lines.append(self.regions[index])
+            else:
+                lines.append(line)
+        if seen != list(range(len(self.regions))):
+            return None
+        return '\n'.join(lines)
+
+
+def imported_names(code: str, component_stems: List[str]) -> Set[str]:
+    """
+    Finds the local names the file binds for imports of the given components,
+    e.g. `InvoiceTable` for `import InvoiceTable from "@/components/invoice-table"`.
+    """
+    patterns = [re.compile(rf'/components/{re.escape(stem)}(?![\w-])') for stem in component_stems]
+    names = set()
+    for match in IMPORT_PATTERN.finditer(code):
+        if not any(pattern.search(match.group(1)) for pattern in patterns):
+            continue
+        clause = match.group(0).split('from')[0].replace('import', '', 1)
+        clause = clause.replace('type ', '')
+        for part in re.split(r'[{},]', clause):
+            part = part.strip()
+            if not part:
+                continue
+            # `Foo as Bar` binds Bar
+            names.add(part.split(' as ')[-1].strip())
+    return {name for name in names if re.fullmatch(r'[A-Za-z_$][\w$]*', name)}
+
+
+def element_end(code: str, start: int, name: str) -> int:
+    """
+    :param start: Index of the `<` that opens a JSX element.
+    :return: Index just past the end of the element.
+    """
+    depth = 0
+    i = start + 1
+    while i < len(code):
+        char = code[i]
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+        elif char == '>' and depth == 0:
+            if code[i - 1] == '/':
+                return i + 1
+            close = code.find(f'</{name}>', i)
+            return len(code) if close == -1 else close + len(name) + 3
+        i += 1
+    return len(code)
+
+
+def call_end(code: str, start: int) -> int:
+    """
+    :param start: Index of a hook name; the call's closing parenthesis is found from there.
+    :return: Index just past the end of the call.
+    """
+    i = code.find('(', start)
+    depth = 0
+    while 0 <= i < len(code):
+        if code[i] == '(':
+            depth += 1
+        elif code[i] == ')':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return len(code)
+
+
+def line_range(line_starts: List[int], start: int, end: int) -> Tuple[int, int]:
+    """
+    :return: The first and last line numbers covered by the character range.
+    """
+    first = bisect_right(line_starts, start) - 1
+    last = bisect_right(line_starts, max(start, end - 1)) - 1
+    return first, last
+
+
+def slice_reference(code: str, component_stems: List[str]) -> Optional[ReferenceSlice]:
+    """
+    Cuts a referencing file down to its imports, hooks and state, the component signature
+    and the JSX that renders the given components.
+    :param code: The referencing file.
+    :param component_stems: Component filenames without the extension.
+    :return: The excerpt, or None when the file should be sent whole.
+    """
+    lines = code.split('\n')
+    if len(lines) < MIN_SLICE_LINES:
+        return None
+
+    names = imported_names(code, component_stems)
+    if not names:
+        return None
+
+    line_starts = [0]
+    for line in lines[:-1]:
+        line_starts.append(line_starts[-1] + len(line) + 1)
+
+    kept = set()
+
+    def keep(start: int, end: int, context: int = 0):
+        first, last = line_range(line_starts, start, end)
+        kept.update(range(max(0, first - context), min(len(lines), last + context + 1)))
+
+    for match in IMPORT_PATTERN.finditer(code):
+        keep(match.start(), match.end())
+    for index, line in enumerate(lines[:5]):
+        if line.strip().strip(';') in ('"use client"', "'use client'"):
+            kept.add(index)
+    for match in COMPONENT_START_PATTERN.finditer(code):
+        keep(match.start(), match.end())
+    for match in HOOK_PATTERN.finditer(code):
+        keep(match.start(), call_end(code, match.start()))
+
+    usages = 0
+    for name in names:
+        for match in re.finditer(rf'<{re.escape(name)}(?![\w$.])', code):
+            keep(match.start(), element_end(code, match.start(), name), CONTEXT_LINES)
+            usages += 1
+    if not usages:
+        return None
+
+    # Short gaps are cheaper to send than to mark
+    index = 0
+    while index < len(lines):
+        if index in kept:
+            index += 1
+            continue
+        end = index
+        while end < len(lines) and end not in kept:
+            end += 1
+        if end - index < MIN_OMITTED_LINES:
+            kept.update(range(index, end))
+        index = end
+
+    if len(kept) > len(lines) * MAX_KEPT_RATIO:
+        return None
+
+    output = []
+    regions = []
+    index = 0
+    while index < len(lines):
+        if index in kept:
+            output.append(lines[index])
+            index += 1
+            continue
+        end = index
+        while end < len(lines) and end not in kept:
+            end += 1
+        output.append(MARKER.format(len(regions)))
+        regions.append('\n'.join(lines[index:end]))
+        index = end
+
+    return ReferenceSlice('\n'.join(output), regions)
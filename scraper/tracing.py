@@ -0,0 +1,181 @@
+import contextvars
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+# Numeric span attributes that are summed into Prometheus counters
+COUNTER_ATTRIBUTES = ('prompt_tokens', 'completion_tokens', 'retries', 'cache_hit')
+# Span attributes used as Prometheus labels
+LABEL_ATTRIBUTES = ('step',)
+
+# Functions returning extra Prometheus text appended to the span summary
+_metric_collectors = []
+
+
+# Functions called with ('start' or 'end', span) as spans open and close, e.g. to stream progress
+_span_listeners = []
+
+
+def register_metrics(collector):
+    _metric_collectors.append(collector)
+
+
+def register_listener(listener):
+    _span_listeners.append(listener)
+
+
+def unregister_listener(listener):
+    _span_listeners.remove(listener)
+
+
+class Span:
+    def __init__(self, span_id: int, name: str, parent_id: Optional[int], attributes: dict):
+        self.id = span_id
+        self.name = name
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration': self.duration,
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+
+class Tracer:
+    """
+    Records nested, timed spans for each phase of a run.
+    The current span is tracked with a context variable so spans opened inside
+    asyncio tasks (and asyncio.to_thread calls) nest under the span that started them.
+    """
+
+    def __init__(self, max_spans: Optional[int] = None):
+        """
+        :param max_spans: Keep only this many of the most recent spans, for long running processes.
+        """
+        self.max_spans = max_spans
+        self.reset()
+
+    def reset(self):
+        self.run_id = uuid.uuid4().hex
+        self.started = time.time()
+        self.spans: Deque[Span] = deque(maxlen=self.max_spans)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Times a block of work. Attributes can be added while the span is open with Span.set.
+        :param name: The phase being timed, e.g. `scan` or `chain`.
+        :param attributes: Initial attributes, inherited `component` values are filled in from the parent span.
+        """
+        parent = _current_span.get()
+        if parent is not None and 'component' in parent.attributes:
+            attributes.setdefault('component', parent.attributes['component'])
+        with self._lock:
+            span = Span(next(self._ids), name, parent.id if parent else None, attributes)
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        notify('start', span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            with self._lock:
+                self.spans.append(span)
+            notify('end', span)
+            _current_span.reset(token)
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def write_json(self, path: str):
+        """
+        Writes every recorded span to a JSON trace file.
+        """
+        with self._lock:
+            spans = [span.to_dict() for span in sorted(self.spans, key=lambda s: s.id)]
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'run_id': self.run_id, 'started': self.started, 'spans': spans}, file, indent=2)
+
+    def prometheus(self) -> str:
+        """
+        Summarises the spans in the Prometheus text exposition format.
+        """
+        durations: Dict[tuple, List[float]] = {}
+        counters: Dict[tuple, float] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            labels = (('span', span.name),) + tuple(
+                (label, str(span.attributes[label])) for label in LABEL_ATTRIBUTES if label in span.attributes
+            )
+            durations.setdefault(labels, []).append(span.duration or 0.0)
+            if span.error:
+                counters[('errors', labels)] = counters.get(('errors', labels), 0) + 1
+            for attribute in COUNTER_ATTRIBUTES:
+                value = span.attributes.get(attribute)
+                if value:
+                    counters[(attribute, labels)] = counters.get((attribute, labels), 0) + float(value)
+
+        lines = ['# TYPE scraper_span_seconds summary']
+        for labels, values in sorted(durations.items()):
+            label_text = format_labels(labels)
+            lines.append(f'scraper_span_seconds_count{label_text} {len(values)}')
+            lines.append(f'scraper_span_seconds_sum{label_text} {sum(values):.6f}')
+
+        lines.append('# TYPE scraper_span_seconds_max gauge')
+        for labels, values in sorted(durations.items()):
+            lines.append(f'scraper_span_seconds_max{format_labels(labels)} {max(values):.6f}')
+
+        for attribute in COUNTER_ATTRIBUTES + ('errors',):
+            metric = f'scraper_{attribute}_total'
+            samples = sorted((labels, value) for (name, labels), value in counters.items() if name == attribute)
+            if samples:
+                lines.append(f'# TYPE {metric} counter')
+                lines.extend(f'{metric}{format_labels(labels)} {value:g}' for labels, value in samples)
+
+        return '\n'.join(lines) + '\n' + ''.join(collector() for collector in _metric_collectors)
+
+    def write_prometheus(self, path: str):
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.prometheus())
+
+
+def notify(event: str, span: Span):
+    for listener in list(_span_listeners):
+        try:
+            listener(event, span)
+        except Exception as e:
+            print(f'Span listener failed: {e!r}')
+
+
+def format_labels(labels: tuple) -> str:
+    def escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+
+tracer = Tracer()
@@ -0,0 +1,251 @@
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+IDENTIFIER = r'[A-Za-z_$][\w$]*'
+
+# Ways a v0 component is exported, with the group holding the component name
+COMPONENT_PATTERNS = [
+    re.compile(rf'export\s+default\s+(?:async\s+)?function\s+({IDENTIFIER})\s*(?:<[^>]*>)?\s*\('),
+    re.compile(rf'export\s+(?:async\s+)?function\s+({IDENTIFIER})\s*(?:<[^>]*>)?\s*\('),
+    re.compile(rf'export\s+(?:default\s+)?const\s+({IDENTIFIER})\s*(?::\s*[^=]+)?=\s*(?=(?:async\s*)?(?:\(|{IDENTIFIER}\s*=>|React\.(?:memo|forwardRef)))'),
+]
+# From the `=` of a const component to just after the `(` of its parameter list,
+# through `async`, React.memo(...) / React.forwardRef(...) and function expressions
+PARAMETERS_PATTERN = re.compile(rf'\s*(?:async\s*)?(?:React\.(?:memo|forwardRef)\s*(?:<[^>]*>)?\s*\(\s*)?(?:(?:async\s+)?function\s*(?:{IDENTIFIER})?\s*)?(?:<[^>]*>\s*)?\(')
+DEFAULT_EXPORT_PATTERN = re.compile(rf'export\s+default\s+({IDENTIFIER})\s*;?\s*$', re.MULTILINE)
+DECLARATION_PATTERN = re.compile(rf'(?:export\s+)?(interface|type)\s+({IDENTIFIER})\s*(?:<[^>]*>)?\s*(?:extends\s+[^{{]+)?(=)?\s*{{')
+MEMBER_PATTERN = re.compile(rf'^(?:readonly\s+)?({IDENTIFIER}|"[^"]+"|\'[^\']+\')(\?)?\s*(\([^)]*\))?\s*:\s*(.+)$', re.DOTALL)
+COMMENT_PATTERN = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+OPENING = {'{': '}', '(': ')', '[': ']', '<': '>'}
+CLOSING = {v: k for k, v in OPENING.items()}
+
+
+def strip_comments(code: str) -> str:
+    # Keep URLs such as "https://..." intact by only removing comments outside of string literals
+    result = []
+    i = 0
+    while i < len(code):
+        char = code[i]
+        if char in '"\'`':
+            end = skip_string(code, i)
+            result.append(code[i:end])
+            i = end
+        elif code.startswith('//', i) or code.startswith('/*', i):
+            match = COMMENT_PATTERN.match(code, i)
+            i = match.end() if match else len(code)
+        else:
+            result.append(char)
+            i += 1
+    return ''.join(result)
+
+
+def skip_string(code: str, start: int) -> int:
+    quote = code[start]
+    i = start + 1
+    while i < len(code):
+        if code[i] == '\\':
+            i += 2
+            continue
+        if code[i] == quote:
+            return i + 1
+        # Only template literals span lines; an unterminated quote is JSX text such as "Don't"
+        if code[i] == '\n' and quote != '`':
+            return start + 1
+        i += 1
+    return len(code)
+
+
+def matching_brace(code: str, start: int) -> int:
+    """
+    :param start: Index of an opening brace.
+    :return: Index of the matching closing brace, or -1.
+    """
+    depth = 0
+    i = start
+    while i < len(code):
+        char = code[i]
+        if char in '"\'`':
+            i = skip_string(code, i)
+            continue
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return -1
+
+
+def split_members(body: str) -> List[str]:
+    """
+    Splits an object type body on `;`, `,` and newlines that are not nested inside brackets.
+    """
+    members = []
+    depth = 0
+    current = []
+    i = 0
+    while i < len(body):
+        char = body[i]
+        if char in '"\'`':
+            end = skip_string(body, i)
+            current.append(body[i:end])
+            i = end
+            continue
+        # `=>` is an arrow, not a closing angle bracket
+        if char == '>' and i > 0 and body[i - 1] == '=':
+            current.append(char)
+        elif char in OPENING:
+            depth += 1
+            current.append(char)
+        elif char in CLOSING:
+            depth -= 1
+            current.append(char)
+        elif char in ';,\n' and depth == 0:
+            members.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    members.append(''.join(current))
+    return [' '.join(m.split()) for m in members if m.strip()]
+
+
+def parse_members(body: str) -> Optional[Dict[str, str]]:
+    props = {}
+    for member in split_members(body):
+        match = MEMBER_PATTERN.match(member)
+        if not match:
+            # Index signatures and other constructs we do not understand
+            return None
+        name, optional, params, type_text = match.groups()
+        name = name.strip('"\'')
+        type_text = type_text.strip()
+        if params is not None:
+            type_text = f'{params} => {type_text}'
+        props[name + (optional or '')] = type_text
+    return props
+
+
+def parse_declarations(code: str) -> Dict[str, Dict[str, str]]:
+    """
+    Finds the object shaped interfaces and type aliases declared in the file.
+    :return: A dictionary of type names and their members.
+    """
+    declarations = {}
+    for match in DECLARATION_PATTERN.finditer(code):
+        kind, name, equals = match.groups()
+        if kind == 'type' and not equals:
+            continue
+        start = match.end() - 1
+        end = matching_brace(code, start)
+        if end == -1:
+            continue
+        members = parse_members(code[start + 1:end])
+        if members is not None:
+            declarations[name] = members
+    return declarations
+
+
+def parameters_start(code: str, definition) -> Optional[int]:
+    """
+    :param definition: A match ending either just after the `(` of a function's parameter list or at a const's value.
+    :return: The index just after the `(` that opens the parameter list, or None for a bare `props =>` arrow.
+    """
+    if definition.group(0).endswith('('):
+        return definition.end()
+    parameters = PARAMETERS_PATTERN.match(code, definition.end())
+    return parameters.end() if parameters else None
+
+
+def find_component(code: str) -> Optional[Tuple[str, Optional[int]]]:
+    """
+    :return: The exported component name and the index just after the `(` of its parameter list
+        (None if the parameters are not parenthesised), or None.
+    """
+    default = DEFAULT_EXPORT_PATTERN.search(code)
+    if default:
+        definition = re.search(rf'(?:function\s+{default.group(1)}\s*(?:<[^>]*>)?\s*\(|const\s+{default.group(1)}\s*(?::\s*[^=]+)?=\s*)', code)
+        if definition:
+            return default.group(1), parameters_start(code, definition)
+    for pattern in COMPONENT_PATTERNS:
+        match = pattern.search(code)
+        if match and match.group(1)[0].isupper():
+            return match.group(1), parameters_start(code, match)
+    return None
+
+
+def find_props_type(code: str, name: str, position: Optional[int], declarations: Dict[str, dict]) -> Optional[str]:
+    """
+    Works out which declared type describes the component's props.
+    """
+    # React.FC<Props> / FC<Props> annotations on a const
+    annotated = re.search(rf'const\s+{name}\s*:\s*(?:React\.)?FC<\s*({IDENTIFIER})\s*>', code)
+    if annotated and annotated.group(1) in declarations:
+        return annotated.group(1)
+
+    # `({ a, b }: Props)` or `(props: Props)` in the parameter list
+    if position is not None:
+        depth = 1
+        i = position
+        while i < len(code) and depth:
+            if code[i] == '(':
+                depth += 1
+            elif code[i] == ')':
+                depth -= 1
+            i += 1
+        params = code[position:i - 1]
+        typed = re.search(rf':\s*(?:Readonly<\s*)?({IDENTIFIER})\s*>?\s*$', params.strip())
+        if typed and typed.group(1) in declarations:
+            return typed.group(1)
+
+    # Fall back to the conventional `<Name>Props` name
+    for candidate in (f'{name}Props', 'Props'):
+        if candidate in declarations:
+            return candidate
+    return None
+
+
+def extract_component_props(code: str) -> Optional[dict]:
+    """
+    Extracts the exported component name and its props from TSX without calling the LLM.
+    :param code: The component source.
+    :return: A dictionary with the component `name`, its `props` and any other declared `types`
+        the props refer to, or None if the source could not be understood.
+    """
+    code = strip_comments(code)
+    component = find_component(code)
+    if component is None:
+        return None
+    name, position = component
+
+    declarations = parse_declarations(code)
+    props_type = find_props_type(code, name, position, declarations)
+    if props_type is None:
+        return None
+
+    props = declarations[props_type]
+    referenced = {}
+    pending = list(props.values())
+    while pending:
+        type_text = pending.pop()
+        for type_name in re.findall(IDENTIFIER, type_text):
+            if type_name in declarations and type_name != props_type and type_name not in referenced:
+                referenced[type_name] = declarations[type_name]
+                pending.extend(declarations[type_name].values())
+
+    result = {'name': name, 'props': props}
+    if referenced:
+        result['types'] = referenced
+    return result
+
+
+def describe_component(code: str) -> Optional[str]:
+    """
+    :return: The component name and props as a JSON string, in place of prompt6's reply, or None.
+    """
+    component = extract_component_props(code)
+    if component is None:
+        return None
+    return json.dumps(component, indent=2)